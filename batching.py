@@ -0,0 +1,253 @@
+# batching.py - Micro-batching de peticiones concurrentes y pool dedicado de inferencia
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+
+class MicroBatcher:
+    """Agrupa peticiones concurrentes durante unos milisegundos y las procesa en un solo lote"""
+
+    def __init__(self, procesar_lote: Callable[[List[Any]], List[Any]], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, nombre: str = "micro-batcher"):
+        self.procesar_lote = procesar_lote
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+
+        self.lotes = 0
+        self.items = 0
+        self.max_lote = 0
+
+        self._thread = threading.Thread(target=self._run, name=nombre, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item: Any) -> Any:
+        return self.submit(item).result()
+
+    def _recolectar(self) -> List[tuple]:
+        lote = [self._queue.get()]
+        limite = time.monotonic() + self.max_wait
+        while len(lote) < self.max_batch_size:
+            restante = limite - time.monotonic()
+            try:
+                if restante <= 0:
+                    lote.append(self._queue.get_nowait())
+                else:
+                    lote.append(self._queue.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _run(self):
+        while True:
+            lote = self._recolectar()
+            items = [item for item, _ in lote]
+            try:
+                resultados = self.procesar_lote(items)
+                for (_, future), resultado in zip(lote, resultados):
+                    future.set_result(resultado)
+            except Exception as e:
+                for _, future in lote:
+                    future.set_exception(e)
+
+            self.lotes += 1
+            self.items += len(lote)
+            self.max_lote = max(self.max_lote, len(lote))
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.lotes,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.lotes, 2) if self.lotes else 0.0,
+            "largest_batch": self.max_lote,
+            "queued": self._queue.qsize()
+        }
+
+
+class InferenceExecutor:
+    """Pool de hilos dedicado a inferencia, separado del threadpool de Starlette, con métricas de cola"""
+
+    def __init__(self, max_workers: int, nombre: str = "inference"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=nombre)
+        self._lock = threading.Lock()
+        self._esperas = deque(maxlen=1000)
+
+        self.en_cola = 0
+        self.en_curso = 0
+        self.completadas = 0
+        self.fallidas = 0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        encolado = time.perf_counter()
+        with self._lock:
+            self.en_cola += 1
+
+        def tarea():
+            with self._lock:
+                self.en_cola -= 1
+                self.en_curso += 1
+                self._esperas.append(time.perf_counter() - encolado)
+            try:
+                resultado = fn(*args)
+                with self._lock:
+                    self.completadas += 1
+                return resultado
+            except Exception:
+                with self._lock:
+                    self.fallidas += 1
+                raise
+            finally:
+                with self._lock:
+                    self.en_curso -= 1
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, tarea)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            esperas = sorted(self._esperas)
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.en_cola,
+                "running": self.en_curso,
+                "completed": self.completadas,
+                "failed": self.fallidas,
+                "wait_ms_avg": round(1000 * sum(esperas) / len(esperas), 3) if esperas else 0.0,
+                "wait_ms_p95": round(1000 * esperas[int(0.95 * (len(esperas) - 1))], 3) if esperas else 0.0,
+                "wait_ms_max": round(1000 * esperas[-1], 3) if esperas else 0.0
+            }
+
+
+class GroupCommit:
+    """Agrupa mutaciones durante una ventana (o hasta un máximo) y las confirma con una sola persistencia"""
+
+    def __init__(self, persistir: Callable[[List[Any]], bool], ventana_ms: float = 50.0, max_lote: int = 256,
+                 nombre: str = "group-commit"):
+        self.persistir = persistir
+        self.ventana = ventana_ms / 1000.0
+        self.max_lote = max_lote
+        self._cond = threading.Condition()
+        self._pendientes: List[tuple] = []
+        self._futuro = Future()
+        self._commit_lock = threading.Lock()
+        self._metricas_lock = threading.Lock()
+
+        self.commits = 0
+        self.fallidos = 0
+        self.mutaciones = 0
+        self.mayor_lote = 0
+        self._latencias = deque(maxlen=1000)
+        self._esperas = deque(maxlen=1000)
+
+        self._thread = None
+        if self.ventana > 0:
+            self._thread = threading.Thread(target=self._run, name=nombre, daemon=True)
+            self._thread.start()
+
+    def registrar(self, item: Any) -> Future:
+        """Encola la mutación; el Future se resuelve con el resultado de la persistencia que la incluye"""
+        return self.registrar_lote([item])
+
+    def registrar_lote(self, items: List[Any]) -> Future:
+        """Encola varias mutaciones juntas: siempre quedan en la misma persistencia. Se puede llamar con los
+        locks del llamador tomados: nunca persiste aquí (sin ventana lo hace despachar())"""
+        encolado = time.perf_counter()
+        with self._cond:
+            self._pendientes.extend((item, encolado) for item in items)
+            if self._thread is not None and (len(self._pendientes) == len(items)
+                                             or len(self._pendientes) >= self.max_lote):
+                self._cond.notify()
+            return self._futuro
+
+    def despachar(self):
+        """Sin ventana: persiste lo encolado en el hilo que llama, que no debe tener tomados sus propios locks"""
+        if self._thread is None:
+            self.flush()
+
+    def _esperar_lote(self):
+        with self._cond:
+            while not self._pendientes:
+                self._cond.wait()
+            limite = self._pendientes[0][1] + self.ventana
+            while len(self._pendientes) < self.max_lote:
+                restante = limite - time.perf_counter()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+
+    def _confirmar(self, lote: List[tuple]) -> bool:
+        inicio = time.perf_counter()
+        try:
+            ok = bool(self.persistir([item for item, _ in lote]))
+        except Exception:
+            ok = False
+        fin = time.perf_counter()
+        with self._metricas_lock:
+            self.commits += 1
+            self.fallidos += not ok
+            self.mutaciones += len(lote)
+            self.mayor_lote = max(self.mayor_lote, len(lote))
+            self._latencias.append(fin - inicio)
+            self._esperas.extend(fin - encolado for _, encolado in lote)
+        return ok
+
+    def _run(self):
+        while True:
+            self._esperar_lote()
+            self.flush()
+
+    def flush(self) -> bool:
+        """Confirma ya lo pendiente (p. ej. al apagar el servicio). El lote se toma con el lock de commit
+        tomado: las persistencias quedan en el mismo orden en que se encolaron las mutaciones"""
+        with self._commit_lock:
+            with self._cond:
+                lote, futuro = self._pendientes, self._futuro
+                self._pendientes, self._futuro = [], Future()
+            if not lote:
+                return True
+            ok = self._confirmar(lote)
+        futuro.set_result(ok)
+        return ok
+
+    @staticmethod
+    def _percentiles(valores) -> Dict:
+        valores = sorted(valores)
+        if not valores:
+            return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "avg": round(1000 * sum(valores) / len(valores), 3),
+            "p95": round(1000 * valores[int(0.95 * (len(valores) - 1))], 3),
+            "max": round(1000 * valores[-1], 3)
+        }
+
+    def stats(self) -> Dict:
+        with self._cond:
+            pendientes = len(self._pendientes)
+        with self._metricas_lock:
+            latencias, esperas = list(self._latencias), list(self._esperas)
+        return {
+            "window_ms": self.ventana * 1000.0,
+            "max_batch_size": self.max_lote,
+            "commits": self.commits,
+            "failed": self.fallidos,
+            "mutations": self.mutaciones,
+            "avg_batch_size": round(self.mutaciones / self.commits, 2) if self.commits else 0.0,
+            "largest_batch": self.mayor_lote,
+            "pending": pendientes,
+            "commit_ms": self._percentiles(latencias),
+            "mutation_to_durable_ms": self._percentiles(esperas)
+        }
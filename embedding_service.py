@@ -0,0 +1,98 @@
+# embedding_service.py - Servicio local de embeddings: el modelo se carga una sola vez por host
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+import numpy as np
+import uvicorn
+from typing import Dict, List
+import os
+import time
+import logging
+
+from batching import MicroBatcher
+from encoders import ENCODER_BACKEND, crear_encoder
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMBED_PORT = int(os.getenv('EMBED_PORT', '8003'))
+# Backend real del modelo en este proceso (remote no tiene sentido aquí)
+EMBED_BACKEND = os.getenv('EMBED_BACKEND', 'torch' if ENCODER_BACKEND == 'remote' else ENCODER_BACKEND)
+# Peticiones concurrentes que se agrupan en un solo encode
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', '32'))
+EMBED_BATCH_WAIT_MS = float(os.getenv('EMBED_BATCH_WAIT_MS', '3'))
+# Peticiones con más textos que esto (rebuilds) se codifican aparte para no frenar a las consultas
+EMBED_MAX_TEXTOS_LOTE = int(os.getenv('EMBED_MAX_TEXTOS_LOTE', '64'))
+
+app = FastAPI(title="Embedding Service - Encoder compartido", version="1.0.0")
+
+
+class EmbeddingService:
+    def __init__(self):
+        inicio = time.perf_counter()
+        self.encoder = crear_encoder(EMBED_BACKEND)
+        self.batcher = MicroBatcher(self._encode_lote, EMBED_BATCH_SIZE, EMBED_BATCH_WAIT_MS,
+                                    nombre="embed-batcher")
+        self.textos = 0
+        self.peticiones = 0
+        logger.info(f"✅ EmbeddingService listo en {time.perf_counter() - inicio:.2f} segundos")
+
+    def _encode_lote(self, peticiones: List[List[str]]) -> List[np.ndarray]:
+        """Un solo encode para todas las peticiones del lote, repartido de vuelta por petición"""
+        textos = [texto for peticion in peticiones for texto in peticion]
+        embeddings = self.encoder.encode(textos, batch_size=max(len(textos), 1))
+        limites = np.cumsum([0] + [len(peticion) for peticion in peticiones])
+        return [embeddings[limites[i]:limites[i + 1]] for i in range(len(peticiones))]
+
+    def embed(self, textos: List[str]) -> np.ndarray:
+        self.peticiones += 1
+        self.textos += len(textos)
+        if len(textos) > EMBED_MAX_TEXTOS_LOTE:
+            return self.encoder.encode(textos)
+        return self.batcher(textos)
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": self.encoder.backend,
+            "dimension": self.encoder.dimension,
+            "requests": self.peticiones,
+            "texts": self.textos,
+            "batching": self.batcher.stats(),
+            "service": "embedding_service"
+        }
+
+
+embedding_service = EmbeddingService()
+
+#Endpoints
+@app.post("/embed")
+async def embed(request: Request):
+    """Recibe {"textos": [...]} y devuelve float32 little-endian (n x dimension) como octet-stream"""
+    cuerpo = await request.json()
+    textos = cuerpo.get("textos")
+    if not isinstance(textos, list) or not all(isinstance(t, str) for t in textos):
+        raise HTTPException(status_code=422, detail="Se espera {'textos': [str, ...]}")
+    try:
+        embeddings = await run_in_threadpool(embedding_service.embed, textos)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return Response(content=np.ascontiguousarray(embeddings, dtype='<f4').tobytes(),
+                    media_type="application/octet-stream",
+                    headers={"X-Embedding-Dimension": str(embedding_service.encoder.dimension)})
+
+@app.get("/info")
+def info():
+    return {"backend": embedding_service.encoder.backend, "dimension": embedding_service.encoder.dimension,
+            "modelo": embedding_service.encoder.modelo}
+
+@app.get("/stats")
+def get_stats():
+    return embedding_service.get_stats()
+
+@app.get("/health")
+def health_check():
+    return {"status": "healthy", "service": "embedding_service"}
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=EMBED_PORT)
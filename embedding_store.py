@@ -0,0 +1,154 @@
+# embedding_store.py - Embeddings por contenido: hash(modelo + texto) -> vector float32 en archivo por mmap
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prefijo de los archivos del store: .keys (digests de 16 bytes), .f32 (vectores) y .json (dimensión)
+EMBEDDING_STORE = os.getenv('EMBEDDING_STORE', 'embedding_store')
+EMBEDDING_STORE_ENABLED = os.getenv('EMBEDDING_STORE_ENABLED', '1') == '1'
+# Al hacer rebuild se podan las entradas de textos que ya no existen si superan esta fracción
+EMBEDDING_STORE_PRUNE_RATIO = float(os.getenv('EMBEDDING_STORE_PRUNE_RATIO', '0.5'))
+
+_LARGO_CLAVE = 16
+
+
+def clave_texto(modelo_id: str, texto: str) -> bytes:
+    """Digest de 16 bytes del texto con el que se generó el embedding y del encoder que lo generó"""
+    return hashlib.blake2b(f"{modelo_id}\0{texto}".encode('utf-8'), digest_size=_LARGO_CLAVE).digest()
+
+
+class EmbeddingStore:
+    """Store append-only: cada texto nuevo agrega su digest a .keys y su vector a .f32; lectura por mmap.
+    Seguro entre hilos: búsqueda, agregado y poda van bajo self.lock (el modelo corre fuera del lock)"""
+
+    def __init__(self, dimension: int, modelo_id: str, prefijo: str = EMBEDDING_STORE):
+        self.dimension = dimension
+        self.modelo_id = modelo_id
+        self.ruta_claves = f"{prefijo}.keys"
+        self.ruta_vectores = f"{prefijo}.f32"
+        self.ruta_info = f"{prefijo}.json"
+        self.aciertos = 0
+        self.fallos = 0
+        self._mm = None
+        self.lock = threading.Lock()
+        self._abrir()
+
+    def _abrir(self):
+        if os.path.exists(self.ruta_info):
+            with open(self.ruta_info) as f:
+                dimension = json.load(f).get('dimension')
+            if dimension != self.dimension:
+                logger.warning(f"⚠️ Embedding store con dimensión {dimension} != {self.dimension}: se reinicia")
+                self._reiniciar()
+        if not all(os.path.exists(ruta) for ruta in (self.ruta_info, self.ruta_claves, self.ruta_vectores)):
+            self._reiniciar()
+
+        claves = np.fromfile(self.ruta_claves, dtype=f'V{_LARGO_CLAVE}')
+        filas = os.path.getsize(self.ruta_vectores) // (4 * self.dimension)
+        #una escritura cortada deja un archivo más largo que el otro: vale el prefijo común
+        n = min(len(claves), filas)
+        if (n * _LARGO_CLAVE != os.path.getsize(self.ruta_claves)
+                or n * 4 * self.dimension != os.path.getsize(self.ruta_vectores)):
+            logger.warning(f"⚠️ Embedding store incompleto, se conservan {n} entradas")
+            self._truncar(n)
+        self._filas: Dict[bytes, int] = {bytes(c): i for i, c in enumerate(claves[:n])}
+        self._n = n
+        self._mm = None
+        logger.info(f"🗃️ Embedding store: {n} vectores en {self.ruta_vectores}")
+
+    def _reiniciar(self):
+        for ruta in (self.ruta_claves, self.ruta_vectores):
+            open(ruta, 'wb').close()
+        with open(self.ruta_info, 'w') as f:
+            json.dump({'dimension': self.dimension}, f)
+
+    def _truncar(self, n: int):
+        with open(self.ruta_claves, 'r+b') as f:
+            f.truncate(n * _LARGO_CLAVE)
+        with open(self.ruta_vectores, 'r+b') as f:
+            f.truncate(n * 4 * self.dimension)
+
+    def _vectores(self) -> np.ndarray:
+        """Vista mmap del archivo de vectores; se re-mapea cuando crece"""
+        n = self._n
+        if self._mm is None or len(self._mm) != n:
+            if n == 0:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            self._mm = np.memmap(self.ruta_vectores, dtype=np.float32, mode='r', shape=(n, self.dimension))
+        return self._mm
+
+    def __len__(self) -> int:
+        return self._n
+
+    def encode(self, encoder, textos: List[str]) -> np.ndarray:
+        """Como encoder.encode, pero solo los textos nunca vistos pasan por el modelo"""
+        claves = [clave_texto(self.modelo_id, texto) for texto in textos]
+        embeddings = np.empty((len(textos), self.dimension), dtype=np.float32)
+        with self.lock:
+            faltan = self._leer(claves, embeddings)
+            self.aciertos += len(textos) - len(faltan)
+            self.fallos += len(faltan)
+        if len(faltan):
+            #textos repetidos dentro del mismo lote se codifican una sola vez
+            unicos: Dict[bytes, int] = {}
+            for i in faltan:
+                unicos.setdefault(claves[i], i)
+            nuevos = encoder.encode([textos[i] for i in unicos.values()])
+            with self.lock:
+                #otro hilo pudo agregar los mismos textos mientras corría el modelo
+                pendientes = [n for n, clave in enumerate(unicos) if clave not in self._filas]
+                if pendientes:
+                    claves_unicas = list(unicos)
+                    self._agregar([claves_unicas[n] for n in pendientes], np.asarray(nuevos)[pendientes])
+                self._leer([claves[i] for i in faltan], embeddings, faltan)
+        return embeddings
+
+    def _leer(self, claves: List[bytes], destino: np.ndarray, posiciones=None) -> np.ndarray:
+        """Copia a destino los vectores de las claves presentes (bajo self.lock); devuelve las posiciones que faltan"""
+        posiciones = np.arange(len(claves)) if posiciones is None else np.asarray(posiciones)
+        filas = np.array([self._filas.get(clave, -1) for clave in claves], dtype=np.int64)
+        if (filas >= 0).any():
+            destino[posiciones[filas >= 0]] = self._vectores()[filas[filas >= 0]]
+        return posiciones[filas < 0]
+
+    def _agregar(self, claves: List[bytes], vectores: np.ndarray):
+        #vectores primero: una clave nunca apunta a una fila que no está en disco
+        with open(self.ruta_vectores, 'ab') as f:
+            f.write(np.ascontiguousarray(vectores, dtype=np.float32).tobytes())
+        with open(self.ruta_claves, 'ab') as f:
+            f.write(b''.join(claves))
+        for i, clave in enumerate(claves):
+            self._filas[clave] = self._n + i
+        self._n += len(claves)
+
+    def podar(self, textos: List[str]):
+        """Reescribe el store solo con los textos dados si las entradas huérfanas superan la fracción configurada"""
+        vivas = {clave_texto(self.modelo_id, texto) for texto in textos}
+        with self.lock:
+            vivas = [clave for clave in vivas if clave in self._filas]
+            huerfanas = len(self._filas) - len(vivas)
+            if huerfanas <= EMBEDDING_STORE_PRUNE_RATIO * len(self._filas):
+                return
+            vectores = np.array(self._vectores()[[self._filas[clave] for clave in vivas]], dtype=np.float32)
+            self._mm = None
+            #claves vacías primero: si se corta a mitad el store queda vacío, nunca con filas desalineadas
+            open(self.ruta_claves, 'wb').close()
+            for ruta, contenido in ((self.ruta_vectores, vectores.tobytes()), (self.ruta_claves, b''.join(vivas))):
+                with open(f"{ruta}.tmp", 'wb') as f:
+                    f.write(contenido)
+                os.replace(f"{ruta}.tmp", ruta)
+            self._filas = {clave: i for i, clave in enumerate(vivas)}
+            self._n = len(vivas)
+            logger.info(f"🧹 Embedding store podado: {huerfanas} entradas huérfanas eliminadas")
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {"vectores": self._n, "aciertos": self.aciertos, "fallos": self.fallos,
+                    "modelo": self.modelo_id}
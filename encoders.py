@@ -0,0 +1,233 @@
+# encoders.py - Backends intercambiables para generar embeddings (PyTorch, PyTorch int8, ONNX Runtime)
+import json
+import logging
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ENCODER_MODEL = os.getenv('ENCODER_MODEL', 'sentence-transformers/all-mpnet-base-v2')
+# torch | torch_int8 | onnx | onnx_int8 | remote
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'torch')
+# Carpeta con model.onnx + tokenizer; si no existe se exporta desde el modelo PyTorch (requiere torch)
+ENCODER_ONNX_DIR = os.getenv('ENCODER_ONNX_DIR', 'encoder_onnx')
+# Hilos de inferencia del encoder (0 = valor por defecto de la librería)
+ENCODER_THREADS = int(os.getenv('ENCODER_THREADS', '0'))
+ENCODER_BATCH_SIZE = int(os.getenv('ENCODER_BATCH_SIZE', '32'))
+
+# Backend remote: servicio de embeddings local compartido (embedding_service.py)
+ENCODER_URL = os.getenv('ENCODER_URL', 'http://localhost:8003')
+ENCODER_TIMEOUT = float(os.getenv('ENCODER_TIMEOUT', '30'))
+ENCODER_POOL_SIZE = int(os.getenv('ENCODER_POOL_SIZE', '32'))
+# Textos por petición a /embed (los rebuild se parten en varias)
+ENCODER_REMOTE_CHUNK = int(os.getenv('ENCODER_REMOTE_CHUNK', '256'))
+
+# Chequeo de paridad al arrancar contra los vectores ya indexados
+ENCODER_PARITY_CHECK = os.getenv('ENCODER_PARITY_CHECK', '0') == '1'
+ENCODER_PARITY_SAMPLES = int(os.getenv('ENCODER_PARITY_SAMPLES', '64'))
+ENCODER_PARITY_MIN_COS = float(os.getenv('ENCODER_PARITY_MIN_COS', '0.98'))
+
+ENCODER_BACKENDS = ('torch', 'torch_int8', 'onnx', 'onnx_int8', 'remote')
+
+
+class SentenceTransformerEncoder:
+    """SentenceTransformer en CPU; con cuantizar=True las capas Linear pasan a int8 dinámico"""
+
+    def __init__(self, modelo: str = ENCODER_MODEL, cuantizar: bool = False):
+        from sentence_transformers import SentenceTransformer
+
+        self.backend = 'torch_int8' if cuantizar else 'torch'
+        self.modelo = modelo
+        self.model = SentenceTransformer(modelo, device='cpu')
+        if ENCODER_THREADS > 0:
+            import torch
+            torch.set_num_threads(ENCODER_THREADS)
+        if cuantizar:
+            import torch
+            torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, textos: List[str], batch_size: int = ENCODER_BATCH_SIZE) -> np.ndarray:
+        """Embeddings float32 (n, dimension) normalizados L2"""
+        return np.asarray(self.model.encode(textos, normalize_embeddings=True, batch_size=batch_size),
+                          dtype=np.float32)
+
+
+def exportar_onnx(modelo: str = ENCODER_MODEL, carpeta: str = ENCODER_ONNX_DIR) -> str:
+    """Exporta el transformer del SentenceTransformer a ONNX junto con su tokenizer; devuelve la ruta del .onnx"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(modelo, device='cpu')
+    transformer = st[0]
+
+    class _UltimaCapa(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, input_ids, attention_mask):
+            return self.auto_model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+    os.makedirs(carpeta, exist_ok=True)
+    transformer.tokenizer.save_pretrained(carpeta)
+    ejemplo = transformer.tokenizer(['ejemplo de producto'], return_tensors='pt')
+    ruta = os.path.join(carpeta, 'model.onnx')
+    torch.onnx.export(
+        _UltimaCapa(transformer.auto_model).eval(),
+        (ejemplo['input_ids'], ejemplo['attention_mask']),
+        ruta,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['last_hidden_state'],
+        dynamic_axes={'input_ids': {0: 'batch', 1: 'seq'}, 'attention_mask': {0: 'batch', 1: 'seq'},
+                      'last_hidden_state': {0: 'batch', 1: 'seq'}},
+        opset_version=14
+    )
+    with open(os.path.join(carpeta, 'encoder_config.json'), 'w') as f:
+        json.dump({'modelo': modelo, 'max_seq_length': st.max_seq_length,
+                   'dimension': st.get_sentence_embedding_dimension()}, f)
+    logger.info(f"📤 Modelo exportado a ONNX: {ruta}")
+    return ruta
+
+
+class OnnxEncoder:
+    """Transformer exportado a ONNX + mean pooling + normalización (mismo pipeline que all-mpnet-base-v2)"""
+
+    def __init__(self, carpeta: str = ENCODER_ONNX_DIR, modelo: str = ENCODER_MODEL, cuantizar: bool = False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.backend = 'onnx_int8' if cuantizar else 'onnx'
+        self.modelo = modelo
+        ruta = os.path.join(carpeta, 'model.onnx')
+        if not os.path.exists(ruta):
+            exportar_onnx(modelo, carpeta)
+        if cuantizar:
+            ruta = self._cuantizar(ruta)
+
+        with open(os.path.join(carpeta, 'encoder_config.json')) as f:
+            config = json.load(f)
+        self.max_seq_length = config['max_seq_length']
+        self.dimension = config['dimension']
+        self.tokenizer = AutoTokenizer.from_pretrained(carpeta)
+
+        opciones = ort.SessionOptions()
+        if ENCODER_THREADS > 0:
+            opciones.intra_op_num_threads = ENCODER_THREADS
+        self.session = ort.InferenceSession(ruta, opciones, providers=['CPUExecutionProvider'])
+
+    @staticmethod
+    def _cuantizar(ruta: str) -> str:
+        ruta_int8 = ruta.replace('.onnx', '_int8.onnx')
+        if not os.path.exists(ruta_int8):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(ruta, ruta_int8, weight_type=QuantType.QInt8)
+            logger.info(f"🗜️ Modelo ONNX cuantizado a int8: {ruta_int8}")
+        return ruta_int8
+
+    def encode(self, textos: List[str], batch_size: int = ENCODER_BATCH_SIZE) -> np.ndarray:
+        """Embeddings float32 (n, dimension) normalizados L2"""
+        salida = np.empty((len(textos), self.dimension), dtype=np.float32)
+        for inicio in range(0, len(textos), batch_size):
+            tokens = self.tokenizer(textos[inicio:inicio + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors='np')
+            mascara = tokens['attention_mask'].astype(np.int64)
+            ultima_capa = self.session.run(None, {'input_ids': tokens['input_ids'].astype(np.int64),
+                                                  'attention_mask': mascara})[0]
+            #mean pooling sobre tokens reales
+            pesos = mascara[:, :, None].astype(np.float32)
+            pooled = (ultima_capa * pesos).sum(axis=1) / np.clip(pesos.sum(axis=1), 1e-9, None)
+            salida[inicio:inicio + len(pooled)] = pooled / np.clip(
+                np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return salida
+
+
+class RemoteEncoder:
+    """Cliente del servicio de embeddings: conexiones keep-alive en pool y respuesta float32 binaria"""
+
+    def __init__(self, url: str = ENCODER_URL):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        #reintentos solo de conexión: el servicio puede estar arrancando todavía
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=ENCODER_POOL_SIZE,
+                              max_retries=Retry(connect=10, read=0, backoff_factor=0.5))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        info = self.session.get(f"{self.url}/info", timeout=ENCODER_TIMEOUT)
+        info.raise_for_status()
+        info = info.json()
+        self.dimension = info['dimension']
+        self.backend = f"remote:{info['backend']}"
+        self.modelo = info.get('modelo', ENCODER_MODEL)
+
+    def encode(self, textos: List[str], batch_size: int = ENCODER_BATCH_SIZE) -> np.ndarray:
+        """Embeddings float32 (n, dimension) normalizados L2, calculados por el servicio"""
+        partes = []
+        for inicio in range(0, len(textos), ENCODER_REMOTE_CHUNK):
+            respuesta = self.session.post(f"{self.url}/embed",
+                                          json={"textos": textos[inicio:inicio + ENCODER_REMOTE_CHUNK]},
+                                          timeout=ENCODER_TIMEOUT)
+            respuesta.raise_for_status()
+            partes.append(np.frombuffer(respuesta.content, dtype='<f4').reshape(-1, self.dimension))
+        if not partes:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.vstack(partes) if len(partes) > 1 else partes[0].copy()
+
+
+def crear_encoder(backend: str = ENCODER_BACKEND, modelo: str = ENCODER_MODEL):
+    """Encoder según config; todos exponen encode(textos) -> float32 normalizado y dimension"""
+    inicio = time.perf_counter()
+    if backend in ('torch', 'torch_int8'):
+        encoder = SentenceTransformerEncoder(modelo, cuantizar=backend == 'torch_int8')
+    elif backend in ('onnx', 'onnx_int8'):
+        encoder = OnnxEncoder(ENCODER_ONNX_DIR, modelo, cuantizar=backend == 'onnx_int8')
+    elif backend == 'remote':
+        encoder = RemoteEncoder(ENCODER_URL)
+    else:
+        raise ValueError(f"Backend de encoder desconocido: {backend}")
+    logger.info(f"🧠 Encoder {backend} listo en {time.perf_counter() - inicio:.2f} segundos")
+    return encoder
+
+
+def identidad_encoder(encoder) -> str:
+    """Modelo + backend efectivo: identifica qué vectores produce el encoder (remote:X produce los de X)"""
+    backend = encoder.backend.split(':', 1)[-1]
+    return f"{encoder.modelo}|{backend}"
+
+
+def verificar_paridad(encoder, textos: List[str], referencia: np.ndarray,
+                      min_cos: float = ENCODER_PARITY_MIN_COS) -> Dict:
+    """Coseno entre los embeddings del encoder y los de referencia (p. ej. los ya indexados con el modelo fp32)"""
+    if not textos:
+        return {"muestras": 0, "ok": True}
+    vectores = encoder.encode(textos)
+    referencia = np.asarray(referencia, dtype=np.float32)
+    referencia = referencia / np.clip(np.linalg.norm(referencia, axis=1, keepdims=True), 1e-12, None)
+    cosenos = np.sum(vectores * referencia, axis=1)
+    resultado = {
+        "backend": encoder.backend,
+        "muestras": len(textos),
+        "cos_min": round(float(cosenos.min()), 4),
+        "cos_medio": round(float(cosenos.mean()), 4),
+        "ok": bool(cosenos.min() >= min_cos)
+    }
+    if resultado["ok"]:
+        logger.info(f"✅ Paridad del encoder: {resultado}")
+    else:
+        logger.warning(f"⚠️ Encoder fuera de paridad con los vectores indexados: {resultado}")
+    return resultado
+
+
+def muestra_paridad(corpus: Dict[int, str], id_to_faiss_idx: Dict[int, int], ntotal: int,
+                    n: int = ENCODER_PARITY_SAMPLES):
+    """Muestra fija del corpus ya indexado: (textos, filas faiss) para comparar contra los vectores guardados"""
+    ids = sorted(i for i in corpus if id_to_faiss_idx.get(i, ntotal) < ntotal)[:n]
+    return [corpus[i] for i in ids], np.array([id_to_faiss_idx[i] for i in ids], dtype=np.int64)
@@ -1,17 +1,30 @@
-from fastapi import FastAPI, Query, HTTPException, BackgroundTasks
+import time
+_INICIO_IMPORT = time.perf_counter()  # para medir la fase de import en el perfil de arranque
+
+from fastapi import FastAPI, Query, HTTPException, BackgroundTasks, Body, Header
 from fastapi.responses import JSONResponse
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-import re
 import warnings
 import uvicorn
-from typing import Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional, Union
 import threading
 import pickle
 import os
 from datetime import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+
+from batching import InferenceExecutor, MicroBatcher
+from encoders import ENCODER_PARITY_CHECK, crear_encoder, muestra_paridad, verificar_paridad
+from index_factory import (INDEX_CONFIG, ParametrosBusqueda, configurar_busqueda, describir_indice, es_comprimido,
+                           leer_indice, parametros_faiss, rerank_exacto)
+from metadata_store import ELIMINADO, METADATA_FILE, MetadataStore, Superpuesto, array_faiss_a_id
+from mutation_log import WAL_FILE, Registro, leer_desde, leer_registros
+from replication import CABECERA_TOKEN, crear_sesion, descargar_log, descargar_snapshot, exigir_token
+from lexical_index import BM25Delta, BM25Index, NgramDelta, NgramIndex, reciprocal_rank_fusion
+from search_cache import LRUCache, normalizar_query
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -19,189 +32,703 @@ logger = logging.getLogger(__name__)
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+BACKUP_FILE = 'search_backup.pkl'
+INDEX_FILE = 'faiss_index.bin'
+VECTORS_FILE = 'faiss_vectors.npy'
+
+# Multi-worker: N procesos comparten el índice FAISS por mmap (page cache del SO)
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '1'))
+INDEX_MMAP = os.getenv('INDEX_MMAP', '1') == '1'
+# Cada worker revisa los archivos de índice y se recarga si otro proceso los cambió (0 lo desactiva)
+INDEX_WATCH_INTERVAL = float(os.getenv('INDEX_WATCH_INTERVAL', '1.0'))
+# Hilos OpenMP de FAISS por proceso; con varios workers conviene 1 para no sobresuscribir la CPU
+FAISS_OMP_THREADS = int(os.getenv('FAISS_OMP_THREADS', '1' if SEARCH_WORKERS > 1 else '0'))
+
+# Candidatos por ranking que se fusionan en modo rrf
+RRF_CANDIDATOS = 100
+RRF_K = 60
+
+SEARCH_MODES = ('hybrid', 'semantic', 'bm25', 'rrf')
+# Clave del score en cada resultado: similitud es siempre coseno (la escala de threshold); BM25 y RRF
+# tienen escalas propias y van en su propia clave
+CAMPO_SCORE = {'hybrid': 'similitud', 'semantic': 'similitud', 'bm25': 'score_bm25', 'rrf': 'score_rrf'}
+
+# Caché de embeddings de consulta (el modelo no cambia entre recargas del índice)
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '10000'))
+EMBEDDING_CACHE_TTL = float(os.getenv('EMBEDDING_CACHE_TTL', '0')) or None
+
+# Caché de resultados finales, invalidada por versión de índice en cada swap
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '2000'))
+
+# Micro-batching de búsquedas semánticas concurrentes (tamaño 1 lo desactiva)
+SEARCH_BATCH_SIZE = int(os.getenv('SEARCH_BATCH_SIZE', '16'))
+SEARCH_BATCH_WAIT_MS = float(os.getenv('SEARCH_BATCH_WAIT_MS', '5'))
+
+# Hilos dedicados a encode + FAISS; deben cubrir al menos un lote completo para que el batching agrupe
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', str(max(4, SEARCH_BATCH_SIZE))))
+
+# Réplica en otro host: el updater empuja los deltas a /replicate/delta; al arrancar (o atrasada) se pone
+# al día con el log o el snapshot de SEARCH_UPSTREAM. SEARCH_PUBLIC_URL es la URL con la que se registra
+SEARCH_UPSTREAM = os.getenv('SEARCH_UPSTREAM', '').rstrip('/')
+SEARCH_PUBLIC_URL = os.getenv('SEARCH_PUBLIC_URL', '')
+# Únicas fuentes desde las que /replicate/catchup descarga log y snapshot: SEARCH_UPSTREAM y esta lista
+SEARCH_UPSTREAM_ALLOWED = {url.strip().rstrip('/') for url in os.getenv('SEARCH_UPSTREAM_ALLOWED', '').split(',')
+                           if url.strip()} | ({SEARCH_UPSTREAM} if SEARCH_UPSTREAM else set())
+# Productos en el delta a partir de los cuales la réplica baja una base más nueva (si el updater la tiene)
+SEARCH_DELTA_MAX = int(os.getenv('SEARCH_DELTA_MAX', '20000'))
+SEARCH_REBASE_INTERVAL = float(os.getenv('SEARCH_REBASE_INTERVAL', '60'))
+
 app = FastAPI(title="FAISS Search Service - Búsqueda Semántica", version="1.0.0")
 
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Estado inmutable del índice activo; se reemplaza completo en cada recarga"""
+    index: Any
+    productos: Dict[int, Dict]
+    corpus: Dict[int, str]
+    id_to_faiss_idx: Dict[int, int]
+    faiss_a_id: np.ndarray  # int64 por fila FAISS, -1 si la fila no tiene producto
+    ngram_index: NgramIndex
+    bm25_index: BM25Index
+    version: int = 0
+    origen: Tuple = ()
+    vectores: Optional[np.ndarray] = None  # float32 por mmap para re-rankear índices comprimidos
+    # Mutaciones del log aplicadas sobre el snapshot base sin volver a leer sus archivos
+    seq: int = 0  # último registro del log incluido
+    posicion_log: Tuple = (0, 0)  # (inodo, offset) hasta donde se leyó el log
+    base: Optional["IndexSnapshot"] = None  # snapshot leído de disco que comparten todos los deltas
+    delta: Dict[int, Optional[Tuple[Dict, str, int]]] = field(default_factory=dict)  # id -> (producto, texto, slot)
+    delta_index: Optional[Any] = None  # vectores nuevos en un IndexFlatIP con id = slot
+    delta_vectores: Dict[int, np.ndarray] = field(default_factory=dict)
+    tombstones_base: int = 0  # slots de la base enmascarados por el delta
+    epoca: int = 0  # numeración de slots de la base; los registros de otra época no aplican
+    slots_muertos: int = 0  # slots del índice base sin producto (HNSW/binario no pueden borrar vectores)
+    
+    @classmethod
+    def crear(cls, index, productos: Dict[int, Dict], corpus: Dict[int, str], id_to_faiss_idx: Dict[int, int],
+              faiss_idx_to_id: Union[Dict[int, int], np.ndarray], version: int = 0, origen: Tuple = (),
+              vectores: Optional[np.ndarray] = None, seq: int = 0, epoca: int = 0) -> "IndexSnapshot":
+        """Construye también los índices léxicos y el mapeo vectorizado; se llama fuera del camino de lectura"""
+        faiss_a_id = array_faiss_a_id(faiss_idx_to_id, index.ntotal)
+        return cls(index, productos, corpus, id_to_faiss_idx, faiss_a_id,
+                   NgramIndex(productos), BM25Index(productos), version, origen, vectores, seq, epoca=epoca,
+                   slots_muertos=int(np.count_nonzero(faiss_a_id[:index.ntotal] < 0)))
+    
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + (self.delta_index.ntotal if self.delta_index is not None else 0)
+    
+    def con_delta(self, registros: List[Registro], posicion: Tuple) -> "IndexSnapshot":
+        """Snapshot nuevo = base compartida + delta acumulado; solo se copian las estructuras del delta
+        (y el mapeo slot -> producto, un array int64)"""
+        base = self.base or self
+        delta = dict(self.delta)
+        delta_vectores = dict(self.delta_vectores)
+        n = max([len(self.faiss_a_id)] + [registro.slot + 1 for registro in registros])
+        faiss_a_id = np.array(array_faiss_a_id(self.faiss_a_id, n), dtype=np.int64)
+        
+        for registro in registros:
+            producto_id = registro.producto_id
+            actual = delta[producto_id] if producto_id in delta else base._entrada(producto_id)
+            if actual is not None and actual[2] >= 0 and (registro.op == 'delete' or registro.embedding is not None):
+                faiss_a_id[actual[2]] = -1
+                delta_vectores.pop(actual[2], None)
+            if registro.op == 'delete':
+                delta[producto_id] = None
+                continue
+            texto = registro.texto if registro.texto is not None else (actual[1] if actual else '')
+            slot = actual[2] if actual else -1
+            if registro.embedding is not None:
+                slot = registro.slot
+                delta_vectores[slot] = registro.embedding
+                faiss_a_id[slot] = producto_id
+            delta[producto_id] = (registro.producto, texto, slot)
+        
+        delta_index = None
+        if delta_vectores:
+            vectores = np.vstack(list(delta_vectores.values())).astype(np.float32)
+            delta_index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectores.shape[1]))
+            delta_index.add_with_ids(vectores, np.fromiter(delta_vectores, dtype=np.int64, count=len(delta_vectores)))
+        
+        cambiados = {producto_id: entrada[0] for producto_id, entrada in delta.items() if entrada is not None}
+        excluidos = set(delta)
+        def superponer(mapping, campo: int):
+            return Superpuesto(mapping, {producto_id: ELIMINADO if entrada is None else entrada[campo]
+                                         for producto_id, entrada in delta.items()})
+        
+        n_base = len(base.faiss_a_id)
+        tombstones = int(np.count_nonzero(faiss_a_id[:n_base] < 0)) - int(np.count_nonzero(base.faiss_a_id < 0))
+        return IndexSnapshot(
+            base.index, superponer(base.productos, 0), superponer(base.corpus, 1),
+            superponer(base.id_to_faiss_idx, 2), faiss_a_id,
+            NgramDelta(base.ngram_index, cambiados, excluidos), BM25Delta(base.bm25_index, cambiados, excluidos),
+            version=self.version + 1, origen=base.origen, vectores=base.vectores, seq=registros[-1].seq,
+            posicion_log=posicion, base=base, delta=delta, delta_index=delta_index, delta_vectores=delta_vectores,
+            tombstones_base=tombstones, epoca=base.epoca, slots_muertos=base.slots_muertos
+        )
+    
+    def _entrada(self, producto_id: int) -> Optional[Tuple[Dict, str, int]]:
+        if producto_id not in self.productos:
+            return None
+        return (self.productos[producto_id], self.corpus.get(producto_id, ''),
+                self.id_to_faiss_idx.get(producto_id, -1))
+
+
+def archivo_metadatos() -> Optional[str]:
+    """Formato columnar si existe; search_backup.pkl como respaldo para datos sin convertir"""
+    for path in (METADATA_FILE, BACKUP_FILE):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def leer_metadatos(path: str) -> Dict:
+    """Mismas claves que el pickle; con el formato columnar son vistas por mmap, sin objetos por producto"""
+    if path == METADATA_FILE:
+        store = MetadataStore(path)
+        return {'productos': store.productos, 'corpus': store.corpus, 'id_to_faiss_idx': store.id_to_faiss_idx,
+                'faiss_idx_to_id': store.faiss_idx_to_id, 'timestamp': store.timestamp, 'wal_seq': store.wal_seq,
+                'epoca': store.epoca}
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def firma_archivos() -> Tuple:
+    """Identifica la versión en disco de los archivos de índice (inodo, mtime, tamaño)"""
+    firma = []
+    for path in (archivo_metadatos() or METADATA_FILE, INDEX_FILE, VECTORS_FILE):
+        if path == VECTORS_FILE and not os.path.exists(path):
+            continue
+        st = os.stat(path)
+        firma.append((st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(firma)
+
+
+def firma_log() -> Tuple[int, int]:
+    """(inodo, tamaño) del log de mutaciones: si difiere de lo leído hay registros nuevos"""
+    if not os.path.exists(WAL_FILE):
+        return (0, 0)
+    st = os.stat(WAL_FILE)
+    return (st.st_ino, st.st_size)
+
+
+def leer_indice_faiss(path: str):
+    """Lee el índice FAISS por mmap (solo lectura) para que los workers compartan las páginas.
+    IO_FLAG_MMAP_IFC mapea los arrays de vectores/códigos de cualquier tipo (flat, HNSW, SQ, IVF, binario);
+    IO_FLAG_MMAP solo mapea las listas invertidas de IVF y es el respaldo en versiones de FAISS sin IFC"""
+    if INDEX_MMAP:
+        solo_lectura = getattr(faiss, 'IO_FLAG_READ_ONLY', 0)
+        for flag in (getattr(faiss, 'IO_FLAG_MMAP_IFC', None), faiss.IO_FLAG_MMAP):
+            if flag is None:
+                continue
+            try:
+                return leer_indice(path, flag | solo_lectura)
+            except RuntimeError as e:
+                logger.warning(f"⚠️ Índice no soporta mmap (flag {flag}): {e}")
+        logger.warning("⚠️ Índice cargado en memoria: cada worker tiene su copia")
+    return leer_indice(path)
+
+
+def leer_vectores(index, faiss_a_id: np.ndarray) -> Optional[np.ndarray]:
+    """Vectores float32 por slot vía mmap, solo si el índice es comprimido y el archivo cubre todos los slots"""
+    if not es_comprimido(index) or not os.path.exists(VECTORS_FILE):
+        return None
+    vectores = np.load(VECTORS_FILE, mmap_mode='r')
+    if vectores.ndim != 2 or vectores.shape[1] != index.d or len(vectores) < max(len(faiss_a_id), index.ntotal):
+        logger.warning(f"⚠️ {VECTORS_FILE} no coincide con el índice, re-ranking desactivado")
+        return None
+    return vectores
+
 class SearchService:
     def __init__(self):
-        start_time = datetime.now()
-        self.model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-        self.dimension = 768
+        #construir el servicio es barato: modelo e índice se cargan en segundo plano con iniciar()
+        self.encoder = None
+        self.dimension = None
+        self.paridad_encoder = None
+        self.embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE)
+        self.search_batcher = None
+        if SEARCH_BATCH_SIZE > 1:
+            self.search_batcher = MicroBatcher(self._semantic_batch, SEARCH_BATCH_SIZE, SEARCH_BATCH_WAIT_MS,
+                                               nombre="search-batcher")
+        self.executor = InferenceExecutor(INFERENCE_WORKERS, nombre="inference")
         
-        #indice activo (para búsquedas)
-        self.active_index = None
-        self.active_productos = {}
-        self.active_corpus = {}
-        self.active_id_to_faiss_idx = {}
-        self.active_faiss_idx_to_id = {}
+        #snapshot activo: los lectores lo toman por referencia, la recarga lo reemplaza entero
+        self.snapshot = IndexSnapshot.crear(faiss.IndexFlatIP(1), {}, {}, {}, {})
         
-        #indice en carga (para actualizaciones sin interrumpir búsquedas)
-        self.loading_index = None
-        self.loading_productos = {}
-        self.loading_corpus = {}
-        self.loading_id_to_faiss_idx = {}
-        self.loading_faiss_idx_to_id = {}
+        self.reload_lock = threading.RLock()  # Para recarga de índice (solo escritores)
         
-        self.search_lock = threading.RLock()  # Para búsquedas
-        self.reload_lock = threading.RLock()  # Para recarga de índice
+        #arranque: /health responde en cuanto el proceso vive, /ready cuando listo está activo
+        self.listo = threading.Event()
+        self.error_arranque = None
+        self.fases: Dict[str, float] = {"import": round(time.perf_counter() - _INICIO_IMPORT, 3)}
+        self._hilo_arranque = None
         
-        self._load_index()
-
-        elapsed = (datetime.now() - start_time).total_seconds()
-        logger.info(f"✅ SearchService listo en {elapsed:.2f} segundos")
+        #replicación por push: mientras se baja un snapshot los deltas se rechazan sin pedir otro catch-up
+        self.fuente_replicacion = SEARCH_UPSTREAM or None
+        self.catchup_en_curso = threading.Event()
+        self._sesion_replicacion = None
+        self._ultimo_rebase = 0.0
+        self.replicacion = {"deltas": 0, "registros": 0, "rechazados": 0, "catchups_log": 0,
+                            "catchups_snapshot": 0, "errores": 0}
+    
+    def iniciar(self, esperar: bool = False):
+        """Lanza la carga de modelo e índice en un hilo; con esperar=True bloquea hasta terminar"""
+        if self._hilo_arranque is None:
+            self._hilo_arranque = threading.Thread(target=self._arrancar, name="startup", daemon=True)
+            self._hilo_arranque.start()
+        if esperar:
+            self._hilo_arranque.join()
+    
+    def _arrancar(self):
+        inicio = time.perf_counter()
+        try:
+            #modelo e índice en paralelo: son independientes hasta el warmup
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="startup-model") as pool:
+                carga_modelo = pool.submit(self._cargar_encoder)
+                self._load_index()
+                carga_modelo.result()
+            
+            if self.snapshot.version == 0:
+                #sin archivos de índice: índice vacío con la dimensión real del modelo
+                self.snapshot = IndexSnapshot.crear(faiss.IndexFlatIP(self.dimension), {}, {}, {}, {})
+            if SEARCH_UPSTREAM:
+                self._registrar_en_upstream()
+            if ENCODER_PARITY_CHECK:
+                self.paridad_encoder = self._verificar_encoder()
+            self._warmup()
+            
+            if INDEX_WATCH_INTERVAL > 0:
+                threading.Thread(target=self._vigilar_archivos, name="index-watcher", daemon=True).start()
+            
+            self.fases["total"] = round(time.perf_counter() - inicio, 3)
+            self.listo.set()
+            logger.info(f"✅ SearchService listo en {self.fases['total']:.2f} segundos")
+            logger.info(f"⏱️ Fases de arranque (s): {self.fases}")
+        except Exception as e:
+            self.error_arranque = str(e)
+            logger.error(f"❌ Error en el arranque del servicio: {e}")
+    
+    def _cargar_encoder(self):
+        inicio = time.perf_counter()
+        self.encoder = crear_encoder()
+        self.dimension = self.encoder.dimension
+        self.fases["model"] = round(time.perf_counter() - inicio, 3)
+    
+    def _warmup(self):
+        """Primera inferencia y primera búsqueda fuera del camino de las peticiones"""
+        inicio = time.perf_counter()
+        query_vec = self.encoder.encode(["warmup"])
+        snap = self.snapshot
+        if snap.index.ntotal:
+            snap.index.search(query_vec, 1)
+        self.fases["warmup"] = round(time.perf_counter() - inicio, 3)
+    
+    def _leer_snapshot(self, fases: Optional[Dict[str, float]] = None) -> Tuple[IndexSnapshot, str]:
+        """Lee los archivos de índice y construye un snapshot nuevo sin publicarlo"""
+        fases = {} if fases is None else fases
+        #la firma se toma antes de leer: si cambian durante la lectura, el watcher recarga otra vez
+        origen = firma_archivos()
+        inicio = time.perf_counter()
+        backup_data = leer_metadatos(archivo_metadatos())
+        fases["metadata"] = round(time.perf_counter() - inicio, 3)
         
+        inicio = time.perf_counter()
+        index = leer_indice_faiss(INDEX_FILE)
+        configurar_busqueda(index)
+        fases["faiss_read"] = round(time.perf_counter() - inicio, 3)
+        
+        inicio = time.perf_counter()
+        faiss_a_id = array_faiss_a_id(backup_data.get('faiss_idx_to_id', {}))
+        snapshot = IndexSnapshot.crear(
+            index,
+            backup_data.get('productos', {}),
+            backup_data.get('corpus', {}),
+            backup_data.get('id_to_faiss_idx', {}),
+            faiss_a_id,
+            version=self.snapshot.version + 1,
+            origen=origen,
+            vectores=leer_vectores(index, faiss_a_id),
+            seq=backup_data.get('wal_seq', 0),
+            epoca=backup_data.get('epoca', 0)
+        )
+        fases["lexical"] = round(time.perf_counter() - inicio, 3)
+        
+        #mutaciones del log posteriores al snapshot base: se aplican como delta sin tocar el índice mmap
+        registros, posicion = leer_desde(WAL_FILE, snapshot.seq)
+        if registros:
+            inicio = time.perf_counter()
+            snapshot = snapshot.con_delta(registros, posicion)
+            fases["wal_replay"] = round(time.perf_counter() - inicio, 3)
+            logger.info(f"📜 {len(registros)} mutaciones del log aplicadas sobre el snapshot base")
+        else:
+            snapshot = replace(snapshot, posicion_log=posicion)
+        return snapshot, backup_data.get('timestamp', 'desconocido')
+    
     def _load_index(self):
         try:
-            if os.path.exists('search_backup.pkl') and os.path.exists('faiss_index.bin'):
-                with open('search_backup.pkl', 'rb') as f:
-                    backup_data = pickle.load(f)
-                
+            if archivo_metadatos() and os.path.exists(INDEX_FILE):
                 with self.reload_lock:
-                    self.loading_productos = backup_data.get('productos', {})
-                    self.loading_corpus = backup_data.get('corpus', {})
-                    self.loading_id_to_faiss_idx = backup_data.get('id_to_faiss_idx', {})
-                    self.loading_faiss_idx_to_id = backup_data.get('faiss_idx_to_id', {})
-                    
-                    self.loading_index = faiss.read_index('faiss_index.bin')
-                    
-                    self._atomic_swap()
-                    
-                    timestamp = backup_data.get('timestamp', 'desconocido')
-                    logger.info(f"✅ Índice cargado exitosamente (creado: {timestamp})")
-                    logger.info(f"📊 {len(self.active_productos)} productos disponibles")
+                    snapshot, timestamp = self._leer_snapshot(self.fases)
+                    self._atomic_swap(snapshot)
+                
+                logger.info(f"✅ Índice cargado exitosamente (creado: {timestamp})")
+                logger.info(f"📊 {len(snapshot.productos)} productos disponibles")
             else:
                 logger.warning("⚠️ No se encontraron archivos de índice")
                 
-                self.active_index = faiss.IndexFlatIP(self.dimension)
-                
         except Exception as e:
             logger.error(f"❌ Error cargando índice: {e}")
-            self.active_index = faiss.IndexFlatIP(self.dimension)
     
-    def _atomic_swap(self):
-        with self.search_lock:
-            self.active_index = self.loading_index
-            self.active_productos = self.loading_productos
-            self.active_corpus = self.loading_corpus
-            self.active_id_to_faiss_idx = self.loading_id_to_faiss_idx
-            self.active_faiss_idx_to_id = self.loading_faiss_idx_to_id
-            
-            self.loading_index = None
-            self.loading_productos = {}
-            self.loading_corpus = {}
-            self.loading_id_to_faiss_idx = {}
-            self.loading_faiss_idx_to_id = {}
-            
-            logger.info("🔄 Swap de índice completado")
+    def _verificar_encoder(self) -> Optional[Dict]:
+        """Compara el encoder configurado con los vectores indexados (exactos o del archivo de re-ranking)"""
+        snap = self.snapshot
+        textos, filas = muestra_paridad(snap.corpus, snap.id_to_faiss_idx, snap.index.ntotal)
+        if snap.vectores is not None:
+            referencia = snap.vectores[filas]
+        elif not es_comprimido(snap.index):
+            try:
+                referencia = snap.index.reconstruct_batch(filas) if len(filas) else None
+            except RuntimeError as e:
+                logger.warning(f"⚠️ El índice no permite reconstruir vectores para verificar el encoder: {e}")
+                return None
+        else:
+            logger.warning("⚠️ Sin vectores exactos para verificar la paridad del encoder")
+            return None
+        return verificar_paridad(self.encoder, textos, referencia)
+    
+    def _atomic_swap(self, snapshot: IndexSnapshot):
+        #asignar una referencia es atómico: los lectores ven el snapshot viejo o el nuevo, nunca una mezcla
+        self.snapshot = snapshot
+        logger.info(f"🔄 Swap de índice completado (versión {snapshot.version})")
     
-    def reload_index_from_files(self):
+    def reload_index_from_files(self, seq: Optional[int] = None):
+        """Con la misma base en disco aplica solo los registros nuevos del log (delta);
+        si la base cambió o las generaciones no encajan, recarga completa"""
         try:
-            if not os.path.exists('search_backup.pkl') or not os.path.exists('faiss_index.bin'):
+            if not archivo_metadatos() or not os.path.exists(INDEX_FILE):
                 logger.warning("⚠️ Archivos de índice no encontrados para recarga")
                 return False
             
             with self.reload_lock:
-                with open('search_backup.pkl', 'rb') as f:
-                    backup_data = pickle.load(f)
-                
-                self.loading_productos = backup_data.get('productos', {})
-                self.loading_corpus = backup_data.get('corpus', {})
-                self.loading_id_to_faiss_idx = backup_data.get('id_to_faiss_idx', {})
-                self.loading_faiss_idx_to_id = backup_data.get('faiss_idx_to_id', {})
-                
-                self.loading_index = faiss.read_index('faiss_index.bin')
-                
-                self._atomic_swap()
-                
-                timestamp = backup_data.get('timestamp', 'desconocido')
-                logger.info(f"🔄 Índice recargado exitosamente (timestamp: {timestamp})")
-                return True
+                snap = self.snapshot
+                if firma_archivos() == snap.origen:
+                    if seq is not None and seq <= snap.seq:
+                        logger.info(f"✅ Índice ya en la generación {seq}, recarga omitida")
+                        return True
+                    registros, posicion = leer_desde(WAL_FILE, snap.seq, snap.posicion_log)
+                    if not registros:
+                        if posicion != snap.posicion_log:
+                            self.snapshot = replace(snap, posicion_log=posicion)
+                        logger.info("✅ Índice ya actualizado, recarga omitida")
+                        return True
+                    if registros[0].seq == snap.seq + 1:
+                        inicio = time.perf_counter()
+                        self._atomic_swap(snap.con_delta(registros, posicion))
+                        logger.info(f"🧩 Delta aplicado: {len(registros)} mutaciones hasta seq {registros[-1].seq} "
+                                    f"en {1000 * (time.perf_counter() - inicio):.1f} ms")
+                        return True
+                    logger.warning(f"⚠️ El log salta de seq {snap.seq} a {registros[0].seq}: recarga completa")
+                snapshot, timestamp = self._leer_snapshot()
+                self._atomic_swap(snapshot)
+            
+            logger.info(f"🔄 Índice recargado exitosamente (timestamp: {timestamp})")
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Error recargando índice: {e}")
             return False
     
-    def search(self, query: str, threshold: float = 0.3) -> List[Tuple[int, float]]:
+    def aplicar_deltas(self, registros: List[Registro]) -> Tuple[bool, Dict]:
+        """Delta recibido por HTTP: solo aplica si continúa el seq actual en la misma época;
+        si no, devuelve el estado para que el updater mande la cola del log o pida un catch-up"""
+        with self.reload_lock:
+            snap = self.snapshot
+            nuevos = [registro for registro in registros if registro.seq > snap.seq]
+            if not nuevos:
+                return True, {"seq": snap.seq, "epoca": snap.epoca}
+            if (self.catchup_en_curso.is_set() or nuevos[0].seq != snap.seq + 1
+                    or any(registro.epoca != snap.epoca for registro in nuevos)):
+                self.replicacion["rechazados"] += 1
+                return False, {"seq": snap.seq, "epoca": snap.epoca, "catchup": self.catchup_en_curso.is_set()}
+            inicio = time.perf_counter()
+            snapshot = snap.con_delta(nuevos, snap.posicion_log)
+            self._atomic_swap(snapshot)
+            self.replicacion["deltas"] += 1
+            self.replicacion["registros"] += len(nuevos)
+            logger.info(f"📡 Delta recibido: {len(nuevos)} mutaciones hasta seq {snapshot.seq} "
+                        f"en {1000 * (time.perf_counter() - inicio):.1f} ms")
+        if (len(snapshot.delta) > SEARCH_DELTA_MAX and self.fuente_replicacion
+                and time.monotonic() - self._ultimo_rebase > SEARCH_REBASE_INTERVAL):
+            #delta grande: se baja la base más nueva del updater (si ya compactó su log)
+            self._ultimo_rebase = time.monotonic()
+            threading.Thread(target=self.ponerse_al_dia, args=(self.fuente_replicacion, True),
+                             name="replica-rebase", daemon=True).start()
+        return True, {"seq": snapshot.seq, "epoca": snapshot.epoca}
+    
+    def ponerse_al_dia(self, fuente: str, rebase: bool = False) -> bool:
+        """Réplica atrasada: primero la cola del log de la fuente; si no la cubre (o rebase), el snapshot base"""
+        if self.catchup_en_curso.is_set():
+            return False
+        self.catchup_en_curso.set()
         try:
-            with self.search_lock:
-                if not self.active_index or self.active_index.ntotal == 0:
-                    logger.warning("⚠️ Índice vacío o no disponible")
-                    return []
-                
-                query_vec = self.model.encode([query], normalize_embeddings=True)
-                total_productos = self.active_index.ntotal
-                
-                D, I = self.active_index.search(np.array(query_vec, dtype=np.float32), total_productos)
-                
-                resultados = []
-                for score, faiss_idx in zip(D[0], I[0]):
-                    if faiss_idx in self.active_faiss_idx_to_id and score >= threshold:
-                        producto_id = self.active_faiss_idx_to_id[faiss_idx]
-                        resultados.append((producto_id, float(score)))
-                
-                resultados.sort(key=lambda x: x[1], reverse=True)
-                return resultados
-                
+            if self._sesion_replicacion is None:
+                self._sesion_replicacion = crear_sesion()
+            sesion = self._sesion_replicacion
+            snap = self.snapshot
+            #sin archivos base propios el seq 0 no dice nada: hace falta el snapshot
+            tiene_base = bool(snap.origen)
+            registros = descargar_log(sesion, fuente, snap.seq, snap.epoca) if tiene_base and not rebase else None
+            if registros is None:
+                inicio = time.perf_counter()
+                archivos = descargar_snapshot(sesion, fuente, [VECTORS_FILE, METADATA_FILE, INDEX_FILE],
+                                              seq=(snap.base or snap).seq if tiene_base else None,
+                                              epoca=snap.epoca)
+                if archivos:
+                    with self.reload_lock:
+                        snapshot, timestamp = self._leer_snapshot()
+                        self._atomic_swap(snapshot)
+                    self.replicacion["catchups_snapshot"] += 1
+                    logger.info(f"📥 Snapshot de {fuente} cargado (seq {snapshot.seq}, época {snapshot.epoca}) "
+                                f"en {time.perf_counter() - inicio:.2f} segundos")
+                #los deltas que llegaron mientras tanto se rechazaron: se traen del log
+                self.catchup_en_curso.clear()
+                snap = self.snapshot
+                registros = descargar_log(sesion, fuente, snap.seq, snap.epoca)
+            else:
+                self.catchup_en_curso.clear()
+                self.replicacion["catchups_log"] += 1
+            if registros:
+                self.aplicar_deltas(registros)
+            return True
         except Exception as e:
-            logger.error(f"❌ Error en búsqueda: {e}")
-            return []
+            self.replicacion["errores"] += 1
+            logger.error(f"❌ Error poniéndose al día desde {fuente}: {e}")
+            return False
+        finally:
+            self.catchup_en_curso.clear()
+    
+    def _registrar_en_upstream(self):
+        """Arranque de una réplica: se registra para recibir deltas y trae lo que le falte"""
+        if SEARCH_PUBLIC_URL:
+            try:
+                if self._sesion_replicacion is None:
+                    self._sesion_replicacion = crear_sesion()
+                self._sesion_replicacion.post(f"{SEARCH_UPSTREAM}/replicate/register",
+                                              json={"url": SEARCH_PUBLIC_URL}, timeout=5).raise_for_status()
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo registrar la réplica en {SEARCH_UPSTREAM}: {e}")
+        self.ponerse_al_dia(SEARCH_UPSTREAM)
+    
+    def _vigilar_archivos(self):
+        """Coordina workers: el que recibe /reload_index recarga al instante, los demás al ver la firma nueva"""
+        while True:
+            time.sleep(INDEX_WATCH_INTERVAL)
+            try:
+                snap = self.snapshot
+                if firma_archivos() != snap.origen or firma_log() != snap.posicion_log:
+                    logger.info(f"📂 Archivos de índice modificados, recargando (pid {os.getpid()})")
+                    self.reload_index_from_files()
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"❌ Error vigilando archivos de índice: {e}")
+    
+    def _range_search(self, index, query_vecs: np.ndarray, threshold: float,
+                      params=None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Por consulta, solo los vectores con similitud >= threshold usando range_search de FAISS"""
+        if index.ntotal == 0:
+            vacio = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+            return [vacio] * len(query_vecs)
+        try:
+            lims, D, I = index.range_search(query_vecs, threshold, params=params)
+            return [(D[lims[i]:lims[i + 1]], I[lims[i]:lims[i + 1]]) for i in range(len(query_vecs))]
+        except RuntimeError:
+            # Algunos tipos de índice no implementan range_search
+            D, I = index.search(query_vecs, index.ntotal, params=params)
+            return list(zip(D, I))
     
-    def hybrid_search(self, query: str, threshold: float = 0.3) -> List[Tuple[int, float]]:
-        resultados = self.search(query, threshold)
-        query_lower = query.lower()
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embeddings float32 (n, dimension) de consultas normalizadas; un solo encode para los fallos de caché"""
+        vectores = {}
+        faltantes = []
+        for query in queries:
+            if query in vectores:
+                continue
+            query_vec = self.embedding_cache.get(query)
+            if query_vec is None:
+                vectores[query] = None
+                faltantes.append(query)
+            else:
+                vectores[query] = query_vec
         
-        with self.search_lock:
-            for producto_id, producto in self.active_productos.items():
-                match_exacto = False
-                score_exacto = 1.0
-                
-                descripcion = producto.get('descripcion', '') or ''
-                variante_comb = producto.get('variante_comb', '') or ''
-                
-                if (query_lower in descripcion.lower() or
-                    query_lower in variante_comb.lower()):
-                    match_exacto = True
-                
-                campos_busqueda = [descripcion, variante_comb]
-                
-                for campo in campos_busqueda:
-                    if re.search(re.escape(query_lower), campo.lower()):
-                        match_exacto = True
-                        break
-                
-                if match_exacto:
-                    if not any(result[0] == producto_id for result in resultados):
-                        resultados.insert(0, (producto_id, score_exacto))
-            
-            resultados.sort(key=lambda x: x[1], reverse=True)
+        if faltantes:
+            embeddings = self.encoder.encode(faltantes, batch_size=len(faltantes))
+            for query, embedding in zip(faltantes, embeddings):
+                query_vec = embedding.reshape(1, -1).copy()
+                query_vec.setflags(write=False)
+                self.embedding_cache.put(query, query_vec)
+                vectores[query] = query_vec
+        
+        return np.vstack([vectores[query] for query in queries])
+    
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Embedding float32 (1, dimension) de la consulta normalizada, cacheado por LRU"""
+        return self._encode_queries([normalizar_query(query)])
+    
+    def _mapear_resultados(self, snap: IndexSnapshot, scores: np.ndarray, faiss_idxs: np.ndarray,
+                           threshold: float) -> List[Tuple[int, float]]:
+        #una sola máscara sobre D/I: filas válidas, con producto y sobre el umbral
+        faiss_idxs = np.asarray(faiss_idxs)
+        scores = np.asarray(scores)
+        validos = (faiss_idxs >= 0) & (faiss_idxs < len(snap.faiss_a_id))
+        producto_ids = np.full(len(faiss_idxs), -1, dtype=np.int64)
+        producto_ids[validos] = snap.faiss_a_id[faiss_idxs[validos]]
+        mascara = (producto_ids >= 0) & (scores >= threshold)
+        
+        producto_ids, scores = producto_ids[mascara], scores[mascara]
+        orden = np.argsort(-scores, kind='stable')
+        return list(zip(producto_ids[orden].tolist(), scores[orden].tolist()))
+    
+    def _semantic_batch(self, items: List[Tuple[str, float, Optional[int], ParametrosBusqueda]]
+                        ) -> List[List[Tuple[int, float]]]:
+        """Resuelve un lote de (query normalizada, threshold, k, parámetros) con un encode
+        y una búsqueda FAISS por grupo de (tipo de búsqueda, parámetros)"""
+        query_vecs = self._encode_queries([item[0] for item in items])
+        resultados = [[] for _ in items]
+        
+        snap = self.snapshot
+        index = snap.index
+        if snap.ntotal == 0:
             return resultados
+        delta_index = snap.delta_index
+        
+        grupos = {}
+        for i, (_, _, k, parametros) in enumerate(items):
+            grupos.setdefault((k is None, parametros), []).append(i)
+        
+        #índices comprimidos: se piden más candidatos y se re-rankean con los vectores float32 (mmap)
+        rerank = snap.vectores is not None
+        
+        for (es_rango, parametros), filas in grupos.items():
+            params = parametros_faiss(index, parametros)
+            if es_rango:
+                #sin k: solo los que superan el umbral (range search con el menor umbral del grupo)
+                threshold_min = min(items[i][1] for i in filas)
+                if rerank:
+                    threshold_min -= INDEX_CONFIG['rerank_margin']
+                encontrados = self._range_search(index, query_vecs[filas], threshold_min, params)
+                if delta_index is not None:
+                    #vectores del delta: exactos, sin margen de re-ranking
+                    en_delta = self._range_search(delta_index, query_vecs[filas], min(items[i][1] for i in filas))
+                for pos, (i, (scores, faiss_idxs)) in enumerate(zip(filas, encontrados)):
+                    if rerank:
+                        scores, faiss_idxs = rerank_exacto(snap.vectores, query_vecs[i], faiss_idxs)
+                    if delta_index is not None:
+                        scores = np.concatenate([scores, en_delta[pos][0]])
+                        faiss_idxs = np.concatenate([faiss_idxs, en_delta[pos][1]])
+                    resultados[i] = self._mapear_resultados(snap, scores, faiss_idxs, items[i][1])
+            else:
+                #top-k real: una sola búsqueda con el mayor k del grupo
+                k_max = max(items[i][2] for i in filas)
+                k_base = k_max
+                if rerank:
+                    k_base = max(k_base, INDEX_CONFIG['rerank'])
+                #los slots de la base sin producto (en disco o reemplazados por el delta) siguen en el índice
+                k_base = min(k_base + snap.slots_muertos + snap.tombstones_base, index.ntotal)
+                if k_base:
+                    D, I = index.search(query_vecs[filas], k_base, params=params)
+                else:
+                    D = np.empty((len(filas), 0), dtype=np.float32)
+                    I = np.empty((len(filas), 0), dtype=np.int64)
+                if delta_index is not None:
+                    D_delta, I_delta = delta_index.search(query_vecs[filas], min(k_max, delta_index.ntotal))
+                for fila, i in enumerate(filas):
+                    _, threshold, k, _ = items[i]
+                    scores, faiss_idxs = D[fila], I[fila]
+                    if rerank:
+                        scores, faiss_idxs = rerank_exacto(snap.vectores, query_vecs[i], faiss_idxs)
+                    if delta_index is not None:
+                        scores = np.concatenate([scores, D_delta[fila]])
+                        faiss_idxs = np.concatenate([faiss_idxs, I_delta[fila]])
+                    resultados[i] = self._mapear_resultados(snap, scores, faiss_idxs, threshold)[:k]
+        
+        return resultados
     
-    def get_product_by_id(self, producto_id: int) -> Optional[Dict]:
-        with self.search_lock:
-            return self.active_productos.get(producto_id)
+    def search(self, query: str, threshold: float = 0.3, k: Optional[int] = None,
+               parametros: ParametrosBusqueda = ParametrosBusqueda()) -> List[Tuple[int, float]]:
+        #los errores (encoder remoto caído, timeout) se propagan: el endpoint responde 5xx y nada queda en caché
+        if self.snapshot.ntotal == 0:
+            logger.warning("⚠️ Índice vacío o no disponible")
+            return []
+        
+        item = (normalizar_query(query), threshold, k, parametros)
+        if self.search_batcher:
+            return self.search_batcher(item)
+        return self._semantic_batch([item])[0]
     
-    def get_stats(self) -> Dict:
-        with self.search_lock:
-            return {
-                "total_productos": len(self.active_productos),
-                "faiss_total": self.active_index.ntotal if self.active_index else 0,
-                "dimension": self.dimension,
-                "index_loaded": self.active_index is not None,
-                "service": "faiss_search"
-            }
-
-#Instancia global del servicio
-search_service = SearchService()
- 
-#Endpoints
-@app.get("/search")
-def search_products(query: str = Query(..., description="Texto a buscar"), threshold: float = 0.45):
-    inicio = datetime.now()
-    try:
-        resultados = search_service.hybrid_search(query, threshold)
+    def hybrid_search(self, query: str, threshold: float = 0.3, k: Optional[int] = None,
+                      parametros: ParametrosBusqueda = ParametrosBusqueda()) -> List[Tuple[int, float]]:
+        ngram_index = self.snapshot.ngram_index
+        resultados = self.search(query, threshold, k, parametros)
+        score_exacto = 1.0
+        
+        #coincidencias literales desde el índice de trigramas (sin recorrer el catálogo)
+        vistos = {producto_id for producto_id, _ in resultados}
+        exactos = [(producto_id, score_exacto) for producto_id in ngram_index.buscar(query)
+                   if producto_id not in vistos]
+        
+        resultados = exactos + resultados
+        resultados.sort(key=lambda x: x[1], reverse=True)
+        if k is not None:
+            resultados = resultados[:k]
+        return resultados
+    
+    def bm25_search(self, query: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        return self.snapshot.bm25_index.buscar(query, k)
+    
+    def rrf_search(self, query: str, threshold: float = 0.3, k: Optional[int] = None,
+                   parametros: ParametrosBusqueda = ParametrosBusqueda()) -> List[Tuple[int, float]]:
+        profundidad = max(k or 0, RRF_CANDIDATOS)
+        semanticos = self.search(query, threshold, profundidad, parametros)
+        lexicos = self.bm25_search(query, profundidad)
+        resultados = reciprocal_rank_fusion(semanticos, lexicos, k=RRF_K)
+        if k is not None:
+            resultados = resultados[:k]
+        return resultados
+    
+    def search_by_mode(self, query: str, threshold: float = 0.3, k: Optional[int] = None,
+                       mode: str = 'hybrid', parametros: ParametrosBusqueda = ParametrosBusqueda()
+                       ) -> List[Tuple[int, float]]:
+        query = normalizar_query(query)
+        #la versión se lee antes de buscar: un swap concurrente solo deja una entrada huérfana
+        cache_key = (query, threshold, k, mode, parametros, self.snapshot.version)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
+        
+        if mode == 'semantic':
+            resultados = self.search(query, threshold, k, parametros)
+        elif mode == 'bm25':
+            resultados = self.bm25_search(query, k)
+        elif mode == 'rrf':
+            resultados = self.rrf_search(query, threshold, k, parametros)
+        else:
+            resultados = self.hybrid_search(query, threshold, k, parametros)
         
+        self.result_cache.put(cache_key, tuple(resultados))
+        return resultados
+    
+    def get_product_by_id(self, producto_id: int) -> Optional[Dict]:
+        return self.snapshot.productos.get(producto_id)
+    
+    def buscar_y_formatear(self, query: str, threshold: float, k: Optional[int], mode: str,
+                           parametros: ParametrosBusqueda, decimales: int = 3) -> List[Dict]:
+        """Búsqueda + armado de la respuesta en el mismo hilo del executor (nada de esto corre en el event loop)"""
         data = []
-        for producto_id, score in resultados:
-            producto = search_service.get_product_by_id(producto_id)
+        campo_score = CAMPO_SCORE[mode]
+        for producto_id, score in self.search_by_mode(query, threshold, k, mode, parametros):
+            producto = self.get_product_by_id(producto_id)
             
             if producto:
                 data.append({
@@ -209,33 +736,83 @@ def search_products(query: str = Query(..., description="Texto a buscar"), thres
                     "nombre": producto["nombre"],
                     "descripcion": producto["descripcion"],
                     "variantes_comb": producto["variante_comb"],
-                    "similitud": round(score, 3)
+                    campo_score: round(score, decimales)
                 })
+        return data
+    
+    def get_stats(self) -> Dict:
+        snap = self.snapshot
+        return {
+            "total_productos": len(snap.productos),
+            "faiss_total": snap.index.ntotal,
+            "index": describir_indice(snap.index),
+            "wal_seq": snap.seq,
+            "epoca": snap.epoca,
+            "replicacion": dict(self.replicacion, fuente=self.fuente_replicacion,
+                                catchup_en_curso=self.catchup_en_curso.is_set()),
+            "delta": {"productos": len(snap.delta), "vectores": len(snap.delta_vectores),
+                      "tombstones_base": snap.tombstones_base, "slots_muertos_base": snap.slots_muertos},
+            "rerank_vectores": snap.vectores is not None,
+            "dimension": self.dimension,
+            "encoder": self.encoder.backend if self.encoder else None,
+            "paridad_encoder": self.paridad_encoder,
+            "index_loaded": snap.version > 0,
+            "ready": self.listo.is_set(),
+            "startup_phases": self.fases,
+            "index_version": snap.version,
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+            "search_batching": self.search_batcher.stats() if self.search_batcher else None,
+            "inference_executor": self.executor.stats(),
+            "service": "faiss_search"
+        }
+
+if FAISS_OMP_THREADS > 0:
+    faiss.omp_set_num_threads(FAISS_OMP_THREADS)
+
+#Instancia global del servicio. Con varios workers, el script lanzado (__main__) y su copia en cada
+#hijo spawn (__mp_main__) solo supervisan: el servicio lo crea cada worker al importar faiss_search
+_solo_supervisa = SEARCH_WORKERS > 1 and __name__ in ("__main__", "__mp_main__")
+search_service = None if _solo_supervisa else SearchService()
+ 
+def _exigir_listo():
+    if not search_service.listo.is_set():
+        raise HTTPException(status_code=503, detail="Servicio iniciando, índice o modelo aún no cargados",
+                            headers={"Retry-After": "1"})
+ 
+#Endpoints
+@app.get("/search")
+async def search_products(query: str = Query(..., description="Texto a buscar"),
+                    threshold: float = Query(0.45, description="Similitud coseno mínima (bm25 no la usa)"),
+                    k: Optional[int] = Query(None, ge=1, description="Máximo de resultados (top-k)"),
+                    mode: str = Query("hybrid", pattern=f"^({'|'.join(SEARCH_MODES)})$",
+                                      description="hybrid, semantic, bm25 o rrf"),
+                    nprobe: Optional[int] = Query(None, ge=1, description="Listas IVF a visitar (índices IVF)"),
+                    ef_search: Optional[int] = Query(None, ge=1, description="efSearch (índices HNSW)")):
+    _exigir_listo()
+    inicio = datetime.now()
+    try:
+        parametros = ParametrosBusqueda(nprobe=nprobe, ef_search=ef_search)
+        data = await search_service.executor.run(search_service.buscar_y_formatear, query, threshold, k, mode,
+                                                 parametros, 4 if mode == 'rrf' else 3)
         duracion = (datetime.now() - inicio).total_seconds()
-        logger.info(f"🔎 Búsqueda '{query}' completada en {duracion:.3f}s con {len(data)} resultados")
-        return JSONResponse(content={"query": query, "resultados": data, "duracion_seg": duracion})
+        logger.info(f"🔎 Búsqueda '{query}' ({mode}) completada en {duracion:.3f}s con {len(data)} resultados")
+        return JSONResponse(content={"query": query, "mode": mode, "resultados": data, "duracion_seg": duracion})
         #return JSONResponse(content={"query": query, "resultados": data})
     except Exception as e:
         logger.error(f"❌ Error en búsqueda: {e}")
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @app.get("/search/semantic")
-def semantic_search(query: str = Query(..., description="Texto a buscar"), threshold: float = 0.3):
+async def semantic_search(query: str = Query(..., description="Texto a buscar"), threshold: float = 0.3,
+                    k: Optional[int] = Query(None, ge=1, description="Máximo de resultados (top-k)"),
+                    nprobe: Optional[int] = Query(None, ge=1, description="Listas IVF a visitar (índices IVF)"),
+                    ef_search: Optional[int] = Query(None, ge=1, description="efSearch (índices HNSW)")):
+    _exigir_listo()
     try:
-        resultados = search_service.search(query, threshold)
-        
-        data = []
-        for producto_id, score in resultados:
-            producto = search_service.get_product_by_id(producto_id)
-            
-            if producto:
-                data.append({
-                    "id": producto["id"],
-                    "nombre": producto["nombre"],
-                    "descripcion": producto["descripcion"],
-                    "variantes_comb": producto["variante_comb"],
-                    "similitud": round(score, 3)
-                })
+        parametros = ParametrosBusqueda(nprobe=nprobe, ef_search=ef_search)
+        data = await search_service.executor.run(search_service.buscar_y_formatear, query, threshold, k, 'semantic',
+                                                 parametros)
         
         return JSONResponse(content={"query": query, "resultados": data})
     except Exception as e:
@@ -243,14 +820,49 @@ def semantic_search(query: str = Query(..., description="Texto a buscar"), thres
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @app.post("/reload_index")
-def reload_index_endpoint(background_tasks: BackgroundTasks):
+def reload_index_endpoint(background_tasks: BackgroundTasks, datos: Optional[Dict[str, Any]] = Body(None)):
+    """El updater envía action, product_id y seq (generación del log); con seq se aplica solo el delta"""
     try:
-        background_tasks.add_task(search_service.reload_index_from_files)
+        seq = (datos or {}).get("seq")
+        background_tasks.add_task(search_service.reload_index_from_files, seq)
         return JSONResponse(content={"mensaje": "Recarga de índice iniciada en background"})
     except Exception as e:
         logger.error(f"❌ Error iniciando recarga: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/replicate/delta")
+def replicate_delta_endpoint(cuerpo: bytes = Body(..., media_type='application/octet-stream'),
+                             token: Optional[str] = Header(None, alias=CABECERA_TOKEN)):
+    """Registros del log en binario (mismo formato que el archivo); 409 con seq y época si no encajan"""
+    #los registros modifican el catálogo servido: solo del updater (token compartido)
+    exigir_token(token)
+    _exigir_listo()
+    try:
+        registros = leer_registros(cuerpo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    aplicado, estado = search_service.aplicar_deltas(registros)
+    return JSONResponse(content=estado, status_code=200 if aplicado else 409)
+
+@app.post("/replicate/catchup")
+def replicate_catchup_endpoint(background_tasks: BackgroundTasks, datos: Optional[Dict[str, Any]] = Body(None),
+                               token: Optional[str] = Header(None, alias=CABECERA_TOKEN)):
+    """El updater pide que la réplica baje el snapshot (tras un rebuild o si quedó fuera de la cola del log)"""
+    exigir_token(token)
+    #la fuente del cuerpo solo elige entre las configuradas: nunca se descarga de una URL arbitraria
+    if not SEARCH_UPSTREAM_ALLOWED:
+        raise HTTPException(status_code=400, detail="Réplica sin SEARCH_UPSTREAM ni SEARCH_UPSTREAM_ALLOWED")
+    pedida = str((datos or {}).get("fuente") or '').rstrip('/')
+    if pedida and pedida not in SEARCH_UPSTREAM_ALLOWED:
+        logger.warning(f"⚠️ Catch-up rechazado desde fuente no permitida: {pedida}")
+        raise HTTPException(status_code=403, detail="Fuente de replicación no permitida")
+    fuente = pedida or SEARCH_UPSTREAM
+    if not fuente:
+        raise HTTPException(status_code=400, detail="Falta la fuente del snapshot")
+    search_service.fuente_replicacion = fuente
+    background_tasks.add_task(search_service.ponerse_al_dia, fuente, True)
+    return JSONResponse(content={"mensaje": f"Catch-up desde {fuente} iniciado en background"})
+
 @app.get("/product/{producto_id}")
 def get_product(producto_id: int):
     try:
@@ -272,11 +884,13 @@ def get_stats():
 
 @app.get("/health")
 def health_check():
+    #liveness: responde aunque el arranque en segundo plano no haya terminado
     try:
         stats = search_service.get_stats()
         return {
             "status": "healthy",
             "service": "faiss_search",
+            "ready": stats["ready"],
             "index_loaded": stats["index_loaded"],
             "total_products": stats["total_productos"]
         }
@@ -287,15 +901,29 @@ def health_check():
             "error": str(e)
         }
 
+@app.get("/ready")
+def readiness_check():
+    """Readiness: 200 solo cuando modelo, índice y warmup terminaron"""
+    contenido = {"ready": search_service.listo.is_set(), "service": "faiss_search",
+                 "startup_phases": search_service.fases}
+    if search_service.error_arranque:
+        contenido["error"] = search_service.error_arranque
+    return JSONResponse(content=contenido, status_code=200 if contenido["ready"] else 503)
+
 @app.on_event("startup")
 async def startup_event():
-    logger.info("🚀 FAISS Search Service iniciado")
-    stats = search_service.get_stats()
-    logger.info(f"📊 Productos cargados: {stats['total_productos']}")
+    #uvicorn ya puede aceptar conexiones: la carga sigue en segundo plano
+    search_service.iniciar()
+    logger.info("🚀 FAISS Search Service iniciado, cargando modelo e índice en segundo plano")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    search_service.executor.shutdown()
     logger.info("👋 FAISS Search Service detenido")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
+    if SEARCH_WORKERS > 1:
+        #cada worker importa el módulo y carga su servicio; el índice se comparte por mmap
+        uvicorn.run("faiss_search:app", host="0.0.0.0", port=8002, workers=SEARCH_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
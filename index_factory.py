@@ -0,0 +1,341 @@
+# index_factory.py - Creación de índices FAISS configurables (Flat, IVF, HNSW, SQ, PQ, binario) y sus parámetros de búsqueda
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+INDEX_CONFIG = {
+    'type': os.getenv('INDEX_TYPE', 'flat'),                        # flat | ivf | hnsw | sq8 | sq4 | pq | ivf_pq | binary
+    'nlist': int(os.getenv('INDEX_NLIST', '0')),                    # 0 = automático (~4·√n)
+    'nprobe': int(os.getenv('INDEX_NPROBE', '16')),
+    'hnsw_m': int(os.getenv('INDEX_HNSW_M', '32')),
+    'ef_construction': int(os.getenv('INDEX_EF_CONSTRUCTION', '200')),
+    'ef_search': int(os.getenv('INDEX_EF_SEARCH', '128')),
+    'pq_m': int(os.getenv('INDEX_PQ_M', '96')),                     # subvectores PQ (debe dividir la dimensión)
+    'pq_nbits': int(os.getenv('INDEX_PQ_NBITS', '8')),
+    # Índices comprimidos: candidatos que se re-rankean contra los vectores float32 guardados en disco
+    'rerank': int(os.getenv('INDEX_RERANK', '200')),
+    # Margen bajo el umbral al pedir candidatos por rango a un índice comprimido (scores aproximados)
+    'rerank_margin': float(os.getenv('INDEX_RERANK_MARGIN', '0.05')),
+    # Reducción de dimensión aprendida antes de indexar: '' (ninguna) | pca | opq
+    'transform': os.getenv('INDEX_TRANSFORM', ''),
+    'transform_dim': int(os.getenv('INDEX_TRANSFORM_DIM', '256'))
+}
+
+# Puntos usados para entrenar la transformación (SVD / OPQ) en catálogos grandes
+MAX_PUNTOS_TRANSFORMACION = 100000
+
+# FAISS recomienda al menos ~39 puntos de entrenamiento por centroide
+MIN_PUNTOS_POR_CENTROIDE = 39
+
+
+def binarizar(vectores: np.ndarray) -> np.ndarray:
+    """Signo de cada componente empaquetado en bits: 768 float32 -> 96 bytes"""
+    return np.packbits(np.asarray(vectores) > 0, axis=1)
+
+
+class IndiceBinario:
+    """Adaptador de un IndexBinaryFlat (Hamming) a la interfaz float del resto de índices.
+    Devuelve como score la similitud coseno estimada por la distancia Hamming; el servicio
+    de búsqueda la re-rankea siempre con los vectores float32"""
+
+    def __init__(self, index: faiss.IndexBinary):
+        self.index = index
+        self.d = index.d
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def _similitud(self, distancias: np.ndarray) -> np.ndarray:
+        #signos aleatorios: coseno ≈ cos(π · hamming / d)
+        return np.cos(np.pi * distancias / self.d).astype(np.float32)
+
+    def add(self, vectores: np.ndarray):
+        self.index.add(binarizar(vectores))
+
+    def search(self, vectores: np.ndarray, k: int, params=None):
+        D, I = self.index.search(binarizar(vectores), k)
+        return self._similitud(D), I
+
+    def range_search(self, vectores: np.ndarray, threshold: float, params=None):
+        #umbral de similitud -> radio Hamming equivalente
+        radio = int(np.ceil(self.d * np.arccos(np.clip(threshold, -1.0, 1.0)) / np.pi)) + 1
+        lims, D, I = self.index.range_search(binarizar(vectores), radio)
+        return lims, self._similitud(D), I
+
+
+@dataclass(frozen=True)
+class ParametrosBusqueda:
+    """Perillas de búsqueda por petición; None usa el valor por defecto del índice"""
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+
+def _nlist_para(n: int, config: Dict) -> int:
+    nlist = config['nlist'] or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // MIN_PUNTOS_POR_CENTROIDE))
+
+
+def _entrenar_transformacion(dimension: int, embeddings: np.ndarray, config: Dict) -> faiss.VectorTransform:
+    """Proyección ortonormal dimension -> transform_dim que conserva el producto interno (sin centrar)"""
+    dim_salida = config['transform_dim']
+    muestra = embeddings[:MAX_PUNTOS_TRANSFORMACION]
+
+    if config['transform'] == 'opq':
+        transformacion = faiss.OPQMatrix(dimension, math.gcd(config['pq_m'], dim_salida), dim_salida)
+        transformacion.train(muestra)
+        return transformacion
+
+    #PCA no centrada: los primeros vectores singulares de X (FAISS PCAMatrix resta la media y altera el ranking por IP)
+    _, _, vt = np.linalg.svd(muestra, full_matrices=False)
+    transformacion = faiss.LinearTransform(dimension, dim_salida, False)
+    faiss.copy_array_to_vector(np.ascontiguousarray(vt[:dim_salida], dtype=np.float32).ravel(), transformacion.A)
+    transformacion.is_trained = True
+    return transformacion
+
+
+def _crear_base(tipo: str, dimension: int, datos: Optional[np.ndarray], config: Dict) -> faiss.Index:
+    n = 0 if datos is None else len(datos)
+
+    if tipo == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, config['hnsw_m'], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config['ef_construction']
+    elif tipo == 'ivf' and n >= MIN_PUNTOS_POR_CENTROIDE:
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, _nlist_para(n, config), faiss.METRIC_INNER_PRODUCT)
+        index.train(datos)
+    elif tipo in ('sq8', 'sq4') and n:
+        qtype = faiss.ScalarQuantizer.QT_8bit if tipo == 'sq8' else faiss.ScalarQuantizer.QT_4bit
+        index = faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_INNER_PRODUCT)
+        index.train(datos)
+    elif tipo == 'pq' and n >= 2 ** config['pq_nbits']:
+        index = faiss.IndexPQ(dimension, config['pq_m'], config['pq_nbits'], faiss.METRIC_INNER_PRODUCT)
+        index.train(datos)
+    elif tipo == 'ivf_pq' and n >= max(2 ** config['pq_nbits'], MIN_PUNTOS_POR_CENTROIDE):
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, _nlist_para(n, config), config['pq_m'], config['pq_nbits'],
+                                 faiss.METRIC_INNER_PRODUCT)
+        index.train(datos)
+    elif tipo in ('flat', 'ivf', 'sq8', 'sq4', 'pq', 'ivf_pq'):
+        #sin datos suficientes para entrenar: búsqueda exacta hasta el próximo rebuild
+        index = faiss.IndexFlatIP(dimension)
+    else:
+        raise ValueError(f"Tipo de índice desconocido: {tipo}")
+    return index
+
+
+def crear_indice(dimension: int, embeddings: Optional[np.ndarray] = None, config: Dict = INDEX_CONFIG) -> faiss.Index:
+    """Crea el índice según config, entrena transformación e índice si hace falta y agrega los embeddings.
+    Cada vector se direcciona por su slot (fila i = id i): los IVF guardan ids propios, el resto
+    de índices float va envuelto en IndexIDMap2"""
+    tipo = config['type']
+    n = 0 if embeddings is None else len(embeddings)
+
+    if tipo == 'binary':
+        index = IndiceBinario(faiss.IndexBinaryFlat(dimension))
+    elif config['transform'] and 0 < config['transform_dim'] < dimension and n >= config['transform_dim']:
+        #la transformación se guarda dentro del índice (IndexPreTransform): la búsqueda sigue recibiendo 768-d
+        transformacion = _entrenar_transformacion(dimension, embeddings, config)
+        base = _crear_base(tipo, config['transform_dim'], transformacion.apply(embeddings), config)
+        index = faiss.IndexPreTransform(transformacion, base)
+    else:
+        index = _crear_base(tipo, dimension, embeddings, config)
+
+    if not isinstance(index, IndiceBinario) and faiss.try_extract_index_ivf(index) is None:
+        #IndexIDMap sobre IVF no soporta remove_ids (aborta): el IVF ya almacena ids
+        index = faiss.IndexIDMap2(index)
+    configurar_busqueda(index, config)
+    if n:
+        agregar(index, embeddings, np.arange(n, dtype=np.int64))
+    return index
+
+
+def _usa_ids(index) -> bool:
+    """True si el índice guarda ids explícitos (IndexIDMap2 o IVF) y admite add_with_ids / remove_ids"""
+    if isinstance(index, IndiceBinario):
+        return False
+    return isinstance(faiss.downcast_index(index), faiss.IndexIDMap) or faiss.try_extract_index_ivf(index) is not None
+
+
+def agregar(index, vectores: np.ndarray, slots: np.ndarray):
+    """Agrega vectores con su slot como id; sin ids explícitos los slots deben continuar desde ntotal"""
+    if _usa_ids(index):
+        index.add_with_ids(vectores, np.asarray(slots, dtype=np.int64))
+    else:
+        index.add(vectores)
+
+
+def eliminar(index, slots: np.ndarray) -> bool:
+    """Quita vectores por slot. False si el índice no soporta borrado (HNSW, binario, índices sin ids):
+    el slot queda como tombstone en el mapeo hasta la próxima compactación"""
+    if not _usa_ids(index):
+        return False
+    try:
+        index.remove_ids(np.asarray(slots, dtype=np.int64))
+        return True
+    except RuntimeError:
+        return False
+
+
+def configurar_busqueda(index: faiss.Index, config: Dict = INDEX_CONFIG):
+    """Aplica nprobe / efSearch por defecto a un índice recién creado o leído de disco"""
+    if isinstance(index, IndiceBinario):
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config['nprobe'], ivf.nlist)
+    hnsw = _extraer_hnsw(index)
+    if hnsw is not None:
+        hnsw.hnsw.efSearch = config['ef_search']
+
+
+def _sin_idmap(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    while isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def _desenvolver(index: faiss.Index) -> faiss.Index:
+    """Índice base debajo de envoltorios como IndexIDMap2 e IndexPreTransform"""
+    index = _sin_idmap(index)
+    while isinstance(index, faiss.IndexPreTransform):
+        index = _sin_idmap(index.index)
+    return index
+
+
+def _transformacion(index: faiss.Index) -> Optional[faiss.VectorTransform]:
+    index = _sin_idmap(index)
+    if isinstance(index, faiss.IndexPreTransform) and index.chain.size():
+        return faiss.downcast_VectorTransform(index.chain.at(0))
+    return None
+
+
+def _extraer_hnsw(index: faiss.Index):
+    index = _desenvolver(index)
+    return index if isinstance(index, faiss.IndexHNSW) else None
+
+
+def parametros_faiss(index: faiss.Index, parametros: ParametrosBusqueda) -> Optional[faiss.SearchParameters]:
+    """Traduce ParametrosBusqueda a SearchParameters de FAISS (thread-safe, no modifica el índice)"""
+    if isinstance(index, IndiceBinario):
+        return None
+    params = None
+    if parametros.nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params = faiss.SearchParametersIVF(nprobe=parametros.nprobe)
+    elif parametros.ef_search is not None and _extraer_hnsw(index) is not None:
+        params = faiss.SearchParametersHNSW(efSearch=parametros.ef_search)
+
+    if params is not None and _transformacion(index) is not None:
+        envoltorio = faiss.SearchParametersPreTransform()
+        envoltorio.index_params = params
+        envoltorio.referenced_objects = [params]  # SWIG no mantiene viva la referencia interna
+        params = envoltorio
+    return params
+
+
+def es_comprimido(index: faiss.Index) -> bool:
+    """True si los scores del índice son aproximados y conviene re-rankear con vectores completos"""
+    if isinstance(index, IndiceBinario) or _transformacion(index) is not None:
+        return True
+    base = _desenvolver(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        base = faiss.downcast_index(ivf)
+    return isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexPQ,
+                             faiss.IndexIVFScalarQuantizer, faiss.IndexIVFPQ))
+
+
+def reconstruye_exacto(index) -> bool:
+    """True si el índice guarda el vector float32 exacto de cada slot y lo devuelve por id (IDMap2 sobre flat o
+    HNSW): no hace falta otra copia de los vectores. IVF no tiene mapa id -> lista y los comprimidos pierden precisión"""
+    if isinstance(index, IndiceBinario) or es_comprimido(index):
+        return False
+    return isinstance(faiss.downcast_index(index), faiss.IndexIDMap2)
+
+
+def rerank_exacto(vectores: np.ndarray, query_vec: np.ndarray, faiss_idxs: np.ndarray):
+    """Recalcula el producto interno exacto de los candidatos y los ordena de mayor a menor"""
+    faiss_idxs = faiss_idxs[faiss_idxs >= 0]
+    scores = np.asarray(vectores[faiss_idxs], dtype=np.float32) @ query_vec.ravel()
+    orden = np.argsort(-scores, kind='stable')
+    return scores[orden], faiss_idxs[orden]
+
+
+def medir_recall(index: faiss.Index, embeddings: np.ndarray, k: int = 10, muestras: int = 200,
+                 rerank: int = 0) -> float:
+    """recall@k frente a búsqueda exacta, usando vectores del propio corpus como consultas.
+    Cuenta como acierto todo resultado con score exacto >= al k-ésimo exacto (tolera empates)"""
+    n = len(embeddings)
+    if n == 0:
+        return 1.0
+    k = min(k, n)
+    rng = np.random.default_rng(0)
+    consultas = embeddings[rng.choice(n, min(muestras, n), replace=False)]
+
+    exactos = consultas @ embeddings.T
+    kesimo = -np.partition(-exactos, k - 1, axis=1)[:, k - 1]
+
+    _, I = index.search(consultas, min(max(k, rerank), n))
+    aciertos = 0
+    for fila, candidatos in enumerate(I):
+        if rerank:
+            _, candidatos = rerank_exacto(embeddings, consultas[fila], candidatos)
+        candidatos = candidatos[candidatos >= 0][:k]
+        aciertos += int(np.sum(exactos[fila, candidatos] >= kesimo[fila] - 1e-6))
+    return aciertos / (k * len(consultas))
+
+
+def _bytes_por_vector(index: faiss.Index) -> Optional[int]:
+    try:
+        return index.sa_code_size()
+    except RuntimeError:
+        ivf = faiss.try_extract_index_ivf(index)
+        return ivf.code_size if ivf is not None else None
+
+
+def describir_indice(index: faiss.Index) -> Dict:
+    if isinstance(index, IndiceBinario):
+        return {"tipo": "IndexBinaryFlat", "ntotal": index.ntotal, "dimension": index.d,
+                "bytes_por_vector": index.index.code_size, "comprimido": True}
+    base = _desenvolver(index)
+    info = {"tipo": type(base).__name__, "ntotal": index.ntotal, "dimension": index.d,
+            "bytes_por_vector": _bytes_por_vector(base), "comprimido": es_comprimido(index)}
+    if _usa_ids(index):
+        info["ids_por_slot"] = True
+    transformacion = _transformacion(index)
+    if transformacion is not None:
+        info["transformacion"] = f"{type(transformacion).__name__} {transformacion.d_in}->{transformacion.d_out}"
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        info.update({"nlist": ivf.nlist, "nprobe": ivf.nprobe})
+    hnsw = _extraer_hnsw(index)
+    if hnsw is not None:
+        info.update({"hnsw_m": hnsw.hnsw.nb_neighbors(1), "ef_search": hnsw.hnsw.efSearch})
+    return info
+
+
+def escribir_indice(index, path: str):
+    if isinstance(index, IndiceBinario):
+        faiss.write_index_binary(index.index, path)
+    else:
+        faiss.write_index(index, path)
+
+
+def serializar_indice(index) -> np.ndarray:
+    """Índice float o binario serializado en memoria (uint8), para escribirlo a disco sin tomar locks"""
+    if isinstance(index, IndiceBinario):
+        return faiss.serialize_index_binary(index.index)
+    return faiss.serialize_index(index)
+
+
+def leer_indice(path: str, flags: int = 0):
+    """Lee un índice float o binario (este último envuelto en IndiceBinario)"""
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return IndiceBinario(faiss.read_index_binary(path, flags))
@@ -0,0 +1,356 @@
+# lexical_index.py - Índices léxicos con postings en arrays (persistidos en search_meta.bin, leídos por mmap)
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Minúsculas, sin acentos y separado en palabras"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(texto)
+
+
+# Parámetros de los índices; escribir_metadatos persiste los postings armados con estos valores
+NGRAM_CAMPOS = ('descripcion', 'variante_comb')
+NGRAM_N = 3
+# Relleno al final de cada texto: todo carácter empieza algún n-grama y las consultas más cortas que n
+# se resuelven con los n-gramas que empiezan con ellas
+_RELLENO = '\x00'
+BM25_CAMPOS = ('nombre', 'descripcion', 'variante_comb', 'tags')
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def columnas_texto(productos: Dict[int, Dict], campos: Iterable[str]) -> Tuple[List[int], List[List[str]]]:
+    """ids ordenados y una lista de textos por campo ('' si falta); los metadatos columnares la dan sin armar
+    cada producto"""
+    if hasattr(productos, 'columnas_texto'):
+        return productos.columnas_texto(campos)
+    ids = sorted(productos)
+    return ids, [[str(productos[producto_id].get(campo, '') or '') for producto_id in ids] for campo in campos]
+
+
+def _ngrams(texto: str, n: int) -> Set[str]:
+    return {texto[i:i + n] for i in range(len(texto) - n + 1)}
+
+
+def _idf(n_docs: int, df: int) -> float:
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+class Vocabulario:
+    """Términos ordenados como blob UTF-8 + offsets; la búsqueda binaria no decodifica el vocabulario"""
+
+    def __init__(self, offsets: np.ndarray, datos: np.ndarray):
+        self.offsets, self.datos = offsets, datos
+        self._offsets, self._datos = memoryview(offsets), memoryview(datos)
+        self._n = len(offsets) - 1
+
+    @classmethod
+    def desde_terminos(cls, terminos: List[str]) -> "Vocabulario":
+        codificados = [termino.encode('utf-8') for termino in terminos]
+        offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in codificados], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b''.join(codificados), dtype=np.uint8))
+
+    def _termino(self, i: int) -> bytes:
+        return bytes(self._datos[self._offsets[i]:self._offsets[i + 1]])
+
+    def _insercion(self, clave: bytes) -> int:
+        inicio, fin = 0, self._n
+        while inicio < fin:
+            medio = (inicio + fin) // 2
+            if self._termino(medio) < clave:
+                inicio = medio + 1
+            else:
+                fin = medio
+        return inicio
+
+    def posicion(self, termino: str) -> int:
+        """Posición del término o -1 (el orden por bytes UTF-8 es el mismo que el de sorted() sobre str)"""
+        clave = termino.encode('utf-8')
+        posicion = self._insercion(clave)
+        return posicion if posicion < self._n and self._termino(posicion) == clave else -1
+
+    def rango(self, prefijo: str) -> Tuple[int, int]:
+        """Posiciones [desde, hasta) de los términos que empiezan con el prefijo (0xFF no aparece en UTF-8)"""
+        clave = prefijo.encode('utf-8')
+        return self._insercion(clave), self._insercion(clave + b'\xff')
+
+    def __len__(self) -> int:
+        return self._n
+
+
+def _agrupar(vocab: Dict[str, int], codigos: List[int], cantidades: List[int],
+             *valores: Tuple[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Ordena los pares (término, fila) por término: vocabulario, inicio de cada término y filas (+ valores)"""
+    terminos = sorted(vocab)
+    rango = np.empty(len(vocab), dtype=np.int64)
+    rango[np.fromiter((vocab[termino] for termino in terminos), dtype=np.int64, count=len(terminos))] = \
+        np.arange(len(terminos), dtype=np.int64)
+    claves = rango[np.array(codigos, dtype=np.int64)]
+    filas = np.repeat(np.arange(len(cantidades), dtype=np.int32), cantidades)
+    #estable: dentro de cada término las filas quedan ascendentes
+    orden = np.argsort(claves, kind='stable')
+    inicio = np.zeros(len(terminos) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(claves, minlength=len(terminos)), out=inicio[1:])
+    vocabulario = Vocabulario.desde_terminos(terminos)
+    arrays = {'vocab.offsets': vocabulario.offsets, 'vocab.datos': vocabulario.datos, 'inicio': inicio,
+              'filas': filas[orden]}
+    for nombre, valor in valores:
+        arrays[nombre] = valor[orden]
+    return arrays
+
+
+def postings_ngramas(columnas: List[List[str]], n: int = NGRAM_N) -> Dict[str, np.ndarray]:
+    """Postings de n-gramas (en minúsculas, con relleno al final) como arrays: vocabulario, inicio por n-grama
+    y filas"""
+    vocab: Dict[str, int] = {}
+    codigos: List[int] = []
+    cantidades: List[int] = []
+    for textos in zip(*columnas):
+        grams = set()
+        for texto in textos:
+            grams |= _ngrams(texto.lower() + _RELLENO * (n - 1), n)
+        codigos.extend([vocab.setdefault(gram, len(vocab)) for gram in grams])
+        cantidades.append(len(grams))
+    return _agrupar(vocab, codigos, cantidades)
+
+
+def postings_bm25(columnas: List[List[str]], k1: float = BM25_K1,
+                  b: float = BM25_B) -> Tuple[Dict[str, np.ndarray], float]:
+    """Postings BM25 con el peso de cada (término, fila) ya calculado; devuelve también avgdl"""
+    vocab: Dict[str, int] = {}
+    codigos: List[int] = []
+    tf: List[int] = []
+    cantidades: List[int] = []
+    longitudes: List[int] = []
+    for textos in zip(*columnas):
+        tokens = []
+        for texto in textos:
+            tokens.extend(tokenizar(texto))
+        conteo = Counter(tokens)
+        codigos.extend([vocab.setdefault(termino, len(vocab)) for termino in conteo])
+        tf.extend(conteo.values())
+        cantidades.append(len(conteo))
+        longitudes.append(len(tokens))
+
+    filas = np.repeat(np.arange(len(cantidades), dtype=np.int64), cantidades)
+    codigos_array = np.array(codigos, dtype=np.int64)
+    tf_array = np.array(tf, dtype=np.float32)
+    longitudes_array = np.array(longitudes, dtype=np.float32)
+    avgdl = (float(longitudes_array.mean()) or 1.0) if longitudes else 1.0
+    norma = k1 * (1 - b + b * longitudes_array / avgdl)
+    df = np.bincount(codigos_array, minlength=len(vocab))
+    idf = np.array([_idf(len(longitudes), d) for d in df.tolist()], dtype=np.float32)
+    pesos = (idf[codigos_array] * tf_array * (k1 + 1) / (tf_array + norma[filas])).astype(np.float32)
+    return _agrupar(vocab, codigos, cantidades, ('pesos', pesos)), avgdl
+
+
+def _persistido(productos, nombre: str, parametros: Dict) -> Optional[Tuple[Dict, Dict[str, np.ndarray]]]:
+    """Postings guardados en el archivo de metadatos, si los trae y se armaron con los mismos parámetros"""
+    if not hasattr(productos, 'lexico'):
+        return None
+    guardado = productos.lexico(nombre)
+    if guardado is None or any(guardado[0].get(clave) != valor for clave, valor in parametros.items()):
+        return None
+    return guardado
+
+
+class NgramIndex:
+    """Índice invertido de n-gramas de caracteres para coincidencias de subcadena; los postings son arrays
+    (por mmap si vienen del archivo de metadatos)"""
+
+    def __init__(self, productos: Dict[int, Dict], campos: Iterable[str] = NGRAM_CAMPOS, n: int = NGRAM_N):
+        self.n = n
+        self.campos = tuple(campos)
+        persistido = _persistido(productos, 'ngram', {'campos': list(self.campos), 'n': n, 'relleno': True})
+        if persistido is not None:
+            postings = persistido[1]
+            self.ids = productos.ids
+            #la verificación de candidatos decodifica solo los textos de esas filas
+            self._textos = lambda filas: productos.textos_filas(filas, self.campos)
+        else:
+            ids, columnas = columnas_texto(productos, self.campos)
+            postings = postings_ngramas(columnas, n)
+            self.ids = np.array(ids, dtype=np.int64)
+            self._textos = lambda filas: [[columna[fila] for fila in filas.tolist()] for columna in columnas]
+        self.vocabulario = Vocabulario(postings['vocab.offsets'], postings['vocab.datos'])
+        self.inicio = memoryview(postings['inicio'])
+        self.filas = postings['filas']
+
+    def _posting(self, gram: str) -> Optional[np.ndarray]:
+        posicion = self.vocabulario.posicion(gram)
+        if posicion < 0:
+            return None
+        return self.filas[self.inicio[posicion]:self.inicio[posicion + 1]]
+
+    def _candidatos(self, query_lower: str) -> np.ndarray:
+        if len(query_lower) < self.n:
+            #consulta corta: los n-gramas que empiezan con ella son un rango contiguo del vocabulario y sus
+            #postings un único tramo de filas; con el relleno cada aparición empieza algún n-grama
+            desde, hasta = self.vocabulario.rango(query_lower)
+            marcadas = np.zeros(len(self.ids), dtype=bool)
+            marcadas[self.filas[self.inicio[desde]:self.inicio[hasta]]] = True
+            return np.flatnonzero(marcadas)
+
+        listas = []
+        for gram in _ngrams(query_lower, self.n):
+            posting = self._posting(gram)
+            if posting is None:
+                return np.zeros(0, dtype=np.int64)
+            listas.append(posting)
+
+        #filas ascendentes y sin repetir en cada posting
+        listas.sort(key=len)
+        candidatos = listas[0]
+        for posting in listas[1:]:
+            posiciones = np.minimum(posting.searchsorted(candidatos), len(posting) - 1)
+            candidatos = candidatos[posting[posiciones] == candidatos]
+            if not len(candidatos):
+                break
+        return candidatos
+
+    def buscar(self, query: str) -> List[int]:
+        """Devuelve los productos cuyo texto contiene la consulta literal"""
+        query_lower = query.lower()
+        filas = self._candidatos(query_lower)
+        if len(query_lower) > self.n and len(filas):
+            #hasta n caracteres los postings ya son exactos; con más, la intersección solo acota
+            contiene = np.zeros(len(filas), dtype=bool)
+            for textos in self._textos(filas):
+                contiene |= np.fromiter((query_lower in texto.lower() for texto in textos), dtype=bool, count=len(filas))
+            filas = filas[contiene]
+        #ids ordenados y filas ascendentes: el resultado sale ordenado por id
+        return self.ids[filas].tolist()
+
+    def __contains__(self, producto_id: int) -> bool:
+        fila = int(self.ids.searchsorted(producto_id))
+        return fila < len(self.ids) and self.ids[fila] == producto_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class BM25Index:
+    """BM25 con pesos por término precalculados; buscar solo suma posting lists"""
+
+    def __init__(self, productos: Dict[int, Dict], campos: Iterable[str] = BM25_CAMPOS,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.campos = tuple(campos)
+        self.k1, self.b = k1, b
+        persistido = _persistido(productos, 'bm25', {'campos': list(self.campos), 'k1': k1, 'b': b})
+        if persistido is not None:
+            parametros, postings = persistido
+            self.ids = productos.ids
+            self.avgdl = parametros['avgdl']
+        else:
+            ids, columnas = columnas_texto(productos, self.campos)
+            postings, self.avgdl = postings_bm25(columnas, k1, b)
+            self.ids = np.array(ids, dtype=np.int64)
+        self.vocabulario = Vocabulario(postings['vocab.offsets'], postings['vocab.datos'])
+        self.inicio = memoryview(postings['inicio'])
+        self.filas = postings['filas']
+        self.pesos = postings['pesos']
+
+    def idf(self, df: int) -> float:
+        return _idf(len(self.ids), df)
+
+    def df(self, termino: str) -> int:
+        """Cantidad de productos que contienen el término (0 si no está en el vocabulario)"""
+        posicion = self.vocabulario.posicion(termino)
+        return self.inicio[posicion + 1] - self.inicio[posicion] if posicion >= 0 else 0
+
+    def buscar(self, query: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Devuelve (producto_id, score) ordenados por score BM25"""
+        posiciones = [p for p in (self.vocabulario.posicion(t) for t in set(tokenizar(query))) if p >= 0]
+        if not posiciones:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for posicion in posiciones:
+            inicio, fin = self.inicio[posicion], self.inicio[posicion + 1]
+            scores[self.filas[inicio:fin]] += self.pesos[inicio:fin]
+
+        filas = np.flatnonzero(scores)
+        if k is not None and k < len(filas):
+            filas = filas[np.argpartition(-scores[filas], k - 1)[:k]]
+        filas = filas[np.argsort(-scores[filas], kind='stable')]
+        return [(int(producto_id), float(score)) for producto_id, score in zip(self.ids[filas], scores[filas])]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class NgramDelta:
+    """NgramIndex base inmutable + índice chico de los productos cambiados desde el snapshot base"""
+
+    def __init__(self, base: NgramIndex, cambiados: Dict[int, Dict], excluidos: Set[int]):
+        self.base = base
+        self.delta = NgramIndex(cambiados, base.campos, base.n)
+        self.excluidos = excluidos
+        self._n = len(base) - sum(1 for producto_id in excluidos if producto_id in base) + len(self.delta)
+
+    def buscar(self, query: str) -> List[int]:
+        coincidencias = [producto_id for producto_id in self.base.buscar(query) if producto_id not in self.excluidos]
+        coincidencias.extend(self.delta.buscar(query))
+        coincidencias.sort()
+        return coincidencias
+
+    def __len__(self) -> int:
+        return self._n
+
+
+class BM25Delta:
+    """BM25Index base inmutable + productos cambiados puntuados con las estadísticas (idf, avgdl) de la base"""
+
+    def __init__(self, base: BM25Index, cambiados: Dict[int, Dict], excluidos: Set[int]):
+        self.base = base
+        self.ids = np.fromiter(cambiados.keys(), dtype=np.int64, count=len(cambiados))
+        #productos de la base que ya no valen (cambiados o eliminados)
+        excluir = np.isin(base.ids, np.fromiter(excluidos, dtype=np.int64, count=len(excluidos)))
+        self.excluidos = set(base.ids[excluir].tolist())
+        self._n = len(base) - len(self.excluidos) + len(self.ids)
+
+        self.pesos: List[Dict[str, float]] = []
+        for producto in cambiados.values():
+            tokens = []
+            for campo in base.campos:
+                tokens.extend(tokenizar(str(producto.get(campo, '') or '')))
+            norma = base.k1 * (1 - base.b + base.b * len(tokens) / base.avgdl)
+            pesos = {}
+            for termino, tf in Counter(tokens).items():
+                pesos[termino] = base.idf(base.df(termino) or 1) * tf * (base.k1 + 1) / (tf + norma)
+            self.pesos.append(pesos)
+
+    def buscar(self, query: str, k: Optional[int] = None) -> List[Tuple[int, float]]:
+        terminos = set(tokenizar(query))
+        base = [(producto_id, score) for producto_id, score
+                in self.base.buscar(query, None if k is None else k + len(self.excluidos))
+                if producto_id not in self.excluidos]
+        delta = []
+        for producto_id, pesos in zip(self.ids.tolist(), self.pesos):
+            score = sum(pesos.get(termino, 0.0) for termino in terminos)
+            if score > 0:
+                delta.append((producto_id, float(score)))
+        resultados = sorted(base + delta, key=lambda x: x[1], reverse=True)
+        return resultados if k is None else resultados[:k]
+
+    def __len__(self) -> int:
+        return self._n
+
+
+def reciprocal_rank_fusion(*rankings: List[Tuple[int, float]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fusiona listas ordenadas sumando 1 / (k + posición) por producto"""
+    fusion: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for posicion, (producto_id, _) in enumerate(ranking, start=1):
+            fusion[producto_id] += 1.0 / (k + posicion)
+    return sorted(fusion.items(), key=lambda x: x[1], reverse=True)
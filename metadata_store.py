@@ -0,0 +1,348 @@
+# metadata_store.py - Metadatos del índice en formato columnar leído por mmap (reemplazo de search_backup.pkl)
+import json
+import os
+import pickle
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from lexical_index import (BM25_B, BM25_CAMPOS, BM25_K1, NGRAM_CAMPOS, NGRAM_N, columnas_texto, postings_bm25,
+                           postings_ngramas)
+
+METADATA_FILE = 'search_meta.bin'
+
+_MAGIC = b'SRCHMETA'
+_VERSION = 1
+_ALINEACION = 64
+
+
+def _alinear(n: int) -> int:
+    return (n + _ALINEACION - 1) // _ALINEACION * _ALINEACION
+
+
+def _tipo_columna(valores: List) -> str:
+    no_nulos = [v for v in valores if v is not None]
+    if no_nulos and all(isinstance(v, int) and not isinstance(v, bool) for v in no_nulos):
+        return 'int'
+    return 'str'
+
+
+def array_faiss_a_id(faiss_idx_to_id: Union[Mapping, np.ndarray], n: Optional[int] = None) -> np.ndarray:
+    """Mapeo faiss_idx -> producto_id como array int64 contiguo (-1 = fila sin producto)"""
+    if isinstance(faiss_idx_to_id, np.ndarray):
+        faiss_a_id = np.asarray(faiss_idx_to_id, dtype=np.int64)
+    elif isinstance(faiss_idx_to_id, _PorFaissIdx):
+        faiss_a_id = faiss_idx_to_id.array
+    else:
+        faiss_a_id = np.full(max(faiss_idx_to_id, default=-1) + 1, -1, dtype=np.int64)
+        if faiss_idx_to_id:
+            faiss_a_id[np.fromiter(faiss_idx_to_id.keys(), dtype=np.int64, count=len(faiss_idx_to_id))] = \
+                np.fromiter(faiss_idx_to_id.values(), dtype=np.int64, count=len(faiss_idx_to_id))
+    if n is not None and len(faiss_a_id) < n:
+        faiss_a_id = np.concatenate([faiss_a_id, np.full(n - len(faiss_a_id), -1, dtype=np.int64)])
+    return faiss_a_id
+
+
+def escribir_metadatos(path: str, productos: Dict[int, Dict], corpus: Dict[int, str],
+                       id_to_faiss_idx: Dict[int, int], faiss_idx_to_id: Union[Mapping, np.ndarray],
+                       next_faiss_idx: int = 0, timestamp: str = '', wal_seq: int = 0, epoca: int = 0) -> None:
+    """Escribe ids y mapeos como arrays int64 y cada campo de texto como blob UTF-8 + offsets"""
+    ids = np.array(sorted(productos), dtype=np.int64)
+    secciones: Dict[str, np.ndarray] = {
+        'ids': ids,
+        'faiss_idx': np.array([id_to_faiss_idx.get(int(i), -1) for i in ids], dtype=np.int64),
+    }
+    secciones['faiss_to_id'] = array_faiss_a_id(faiss_idx_to_id)
+
+    #campos en el orden en que aparecen, para reconstruir el dict igual que el original
+    campos: List[str] = []
+    for producto in productos.values():
+        for campo in producto:
+            if campo not in campos:
+                campos.append(campo)
+
+    #estado por fila: 0 = valor, 1 = None, 2 = el producto no tiene el campo
+    ausente = object()
+    columnas = [(campo, [productos[int(i)].get(campo, ausente) for i in ids]) for campo in campos]
+    columnas.append(('__corpus__', [corpus.get(int(i)) for i in ids]))
+    esquema = []
+    for campo, valores in columnas:
+        estados = np.array([2 if v is ausente else int(v is None) for v in valores], dtype=np.uint8)
+        valores = [None if v is ausente else v for v in valores]
+        tipo = _tipo_columna(valores)
+        if tipo == 'int':
+            secciones[f'{campo}.valores'] = np.array([0 if v is None else v for v in valores], dtype=np.int64)
+        else:
+            codificados = [b'' if v is None else str(v).encode('utf-8') for v in valores]
+            offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in codificados], out=offsets[1:])
+            secciones[f'{campo}.offsets'] = offsets
+            secciones[f'{campo}.datos'] = np.frombuffer(b''.join(codificados), dtype=np.uint8)
+        secciones[f'{campo}.estado'] = estados
+        esquema.append({'nombre': campo, 'tipo': tipo})
+
+    #postings léxicos armados una vez acá: el servicio de búsqueda los lee por mmap en cada recarga
+    _, textos = columnas_texto(productos, NGRAM_CAMPOS)
+    for nombre, arr in postings_ngramas(textos, NGRAM_N).items():
+        secciones[f'__ngram__.{nombre}'] = arr
+    _, textos = columnas_texto(productos, BM25_CAMPOS)
+    postings, avgdl = postings_bm25(textos, BM25_K1, BM25_B)
+    for nombre, arr in postings.items():
+        secciones[f'__bm25__.{nombre}'] = arr
+    lexico = {'ngram': {'campos': list(NGRAM_CAMPOS), 'n': NGRAM_N, 'relleno': True},
+              'bm25': {'campos': list(BM25_CAMPOS), 'k1': BM25_K1, 'b': BM25_B, 'avgdl': avgdl}}
+
+    #offsets relativos al inicio de la zona de datos, cada sección alineada a 64 bytes
+    tabla, posicion = {}, 0
+    for nombre, arr in secciones.items():
+        tabla[nombre] = [arr.dtype.str, posicion, len(arr)]
+        posicion = _alinear(posicion + arr.nbytes)
+
+    header = json.dumps({
+        'version': _VERSION, 'n': len(ids), 'timestamp': timestamp, 'next_faiss_idx': next_faiss_idx,
+        'wal_seq': wal_seq, 'epoca': epoca, 'campos': esquema, 'lexico': lexico, 'secciones': tabla
+    }).encode('utf-8')
+    inicio_datos = _alinear(len(_MAGIC) + 8 + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        for nombre, arr in secciones.items():
+            f.seek(inicio_datos + tabla[nombre][1])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(inicio_datos + posicion)
+
+
+class _PorId(Mapping):
+    """Mapping producto_id -> valor; la fila sale de una búsqueda binaria sobre los ids ordenados (mmap),
+    sin estructuras por producto en memoria"""
+
+    def __init__(self, ids: np.ndarray, valor_fila):
+        self.ids = ids
+        self._valor_fila = valor_fila
+
+    def fila(self, producto_id) -> Optional[int]:
+        if not isinstance(producto_id, (int, np.integer)):
+            return None
+        fila = int(self.ids.searchsorted(producto_id))
+        return fila if fila < len(self.ids) and self.ids[fila] == producto_id else None
+
+    def __getitem__(self, producto_id):
+        fila = self.fila(producto_id)
+        if fila is None:
+            raise KeyError(producto_id)
+        return self._valor_fila(fila)
+
+    def __contains__(self, producto_id) -> bool:
+        return self.fila(producto_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class _Productos(_PorId):
+    """productos con acceso por columna: los índices léxicos leen los campos sin armar cada dict"""
+
+    def __init__(self, store: "MetadataStore"):
+        super().__init__(store.ids, store.producto)
+        self._store = store
+
+    def columnas_texto(self, campos) -> Tuple[List[int], List[List[str]]]:
+        return self.ids.tolist(), [self._store.columna_texto(campo) for campo in campos]
+
+    def textos_filas(self, filas: np.ndarray, campos) -> List[List[str]]:
+        return [self._store.textos(campo, filas) for campo in campos]
+
+    def lexico(self, nombre: str) -> Optional[Tuple[Dict, Dict[str, np.ndarray]]]:
+        return self._store.lexico(nombre)
+
+
+class _PorFaissIdx(Mapping):
+    """Mapping faiss_idx -> producto_id sobre un array int64 (-1 = hueco)"""
+
+    def __init__(self, faiss_to_id: np.ndarray):
+        self.array = faiss_to_id
+        self._n = int(np.count_nonzero(faiss_to_id >= 0))
+
+    def __getitem__(self, faiss_idx):
+        if 0 <= faiss_idx < len(self.array) and self.array[faiss_idx] >= 0:
+            return int(self.array[faiss_idx])
+        raise KeyError(faiss_idx)
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(i) for i in np.flatnonzero(self.array >= 0))
+
+    def __len__(self) -> int:
+        return self._n
+
+
+ELIMINADO = object()
+
+
+class Superpuesto(Mapping):
+    """Mapping base inmutable + cambios (ELIMINADO = clave borrada); copiar el overlay no copia la base"""
+
+    def __init__(self, base: Mapping, cambios: Dict):
+        self.base = base
+        self.cambios = cambios
+        self._n = len(base)
+        for clave, valor in cambios.items():
+            en_base = clave in base
+            self._n += (valor is not ELIMINADO) - en_base
+
+    def __getitem__(self, clave):
+        if clave in self.cambios:
+            valor = self.cambios[clave]
+            if valor is ELIMINADO:
+                raise KeyError(clave)
+            return valor
+        return self.base[clave]
+
+    def __contains__(self, clave) -> bool:
+        if clave in self.cambios:
+            return self.cambios[clave] is not ELIMINADO
+        return clave in self.base
+
+    def __iter__(self) -> Iterator:
+        for clave in self.base:
+            if clave not in self.cambios:
+                yield clave
+        for clave, valor in self.cambios.items():
+            if valor is not ELIMINADO:
+                yield clave
+
+    def __len__(self) -> int:
+        return self._n
+
+
+class MetadataStore:
+    """Vista por mmap del archivo columnar; los dicts de producto se construyen solo al pedirlos"""
+
+    def __init__(self, path: str = METADATA_FILE):
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self._mm[:len(_MAGIC)]) != _MAGIC:
+            raise ValueError(f"{path} no es un archivo de metadatos válido")
+        largo = int(self._mm[len(_MAGIC):len(_MAGIC) + 8].view(np.uint64)[0])
+        inicio_header = len(_MAGIC) + 8
+        header = json.loads(bytes(self._mm[inicio_header:inicio_header + largo]).decode('utf-8'))
+        if header['version'] != _VERSION:
+            raise ValueError(f"Versión de metadatos no soportada: {header['version']}")
+        self._inicio_datos = _alinear(inicio_header + largo)
+        self._secciones = header['secciones']
+
+        self.timestamp = header.get('timestamp', '')
+        self.next_faiss_idx = header.get('next_faiss_idx', 0)
+        #último registro del log de mutaciones incluido en este snapshot
+        self.wal_seq = header.get('wal_seq', 0)
+        #numeración de slots: cambia con cada rebuild/compactación, los deltas de otra época no aplican
+        self.epoca = header.get('epoca', 0)
+        self.campos = [c['nombre'] for c in header['campos'] if c['nombre'] != '__corpus__']
+        #parámetros de los postings léxicos persistidos (archivos anteriores no los traen)
+        self._lexico = header.get('lexico', {})
+        #vistas por columna: (tipo, estado, valores u offsets, datos); los memoryview devuelven int/bytes
+        #de Python al indexar, sin escalares numpy por acceso
+        self._columnas = {}
+        for columna in header['campos']:
+            nombre, tipo = columna['nombre'], columna['tipo']
+            estado = memoryview(self._seccion(f'{nombre}.estado'))
+            if tipo == 'int':
+                self._columnas[nombre] = (tipo, estado, memoryview(self._seccion(f'{nombre}.valores')), None)
+            else:
+                self._columnas[nombre] = (tipo, estado, memoryview(self._seccion(f'{nombre}.offsets')),
+                                          memoryview(self._seccion(f'{nombre}.datos')))
+
+        self.ids = self._seccion('ids')
+        self.faiss_idx = memoryview(self._seccion('faiss_idx'))
+        self.faiss_to_id = self._seccion('faiss_to_id')
+
+        #interfaz de dicts igual a la del pickle: productos, corpus y los dos mapeos
+        self.productos = _Productos(self)
+        self.corpus = _PorId(self.ids, lambda fila: self._valor('__corpus__', fila))
+        self.id_to_faiss_idx = _PorId(self.ids, self.faiss_idx.__getitem__)
+        self.faiss_idx_to_id = _PorFaissIdx(self.faiss_to_id)
+
+    def _seccion(self, nombre: str) -> np.ndarray:
+        dtype, offset, n = self._secciones[nombre]
+        dtype = np.dtype(dtype)
+        inicio = self._inicio_datos + offset
+        return self._mm[inicio:inicio + n * dtype.itemsize].view(dtype)
+
+    def _valor(self, campo: str, fila: int):
+        tipo, estado, valores, datos = self._columnas[campo]
+        if estado[fila]:
+            return None
+        if tipo == 'int':
+            return valores[fila]
+        return bytes(datos[valores[fila]:valores[fila + 1]]).decode('utf-8')
+
+    def producto(self, fila: int) -> Dict:
+        return {campo: self._valor(campo, fila) for campo in self.campos if self._columnas[campo][1][fila] != 2}
+
+    def textos(self, campo: str, filas: np.ndarray) -> List[str]:
+        """Como columna_texto pero solo para algunas filas"""
+        if campo not in self._columnas:
+            return [''] * len(filas)
+        tipo, estado, valores, datos = self._columnas[campo]
+        if tipo == 'int':
+            textos = [str(v) for v in np.asarray(valores)[filas].tolist()]
+        else:
+            offsets = np.asarray(valores)
+            textos = [str(datos[inicio:fin], 'utf-8')
+                      for inicio, fin in zip(offsets[filas].tolist(), offsets[filas + 1].tolist())]
+        nulos = np.asarray(estado)[filas]
+        if nulos.any():
+            textos = ['' if nulo else texto for texto, nulo in zip(textos, nulos.tolist())]
+        return textos
+
+    def lexico(self, nombre: str) -> Optional[Tuple[Dict, Dict[str, np.ndarray]]]:
+        """Parámetros y arrays (por mmap) de un índice léxico persistido; None si el archivo no lo trae"""
+        if nombre not in self._lexico:
+            return None
+        prefijo = f'__{nombre}__.'
+        return self._lexico[nombre], {seccion[len(prefijo):]: self._seccion(seccion)
+                                      for seccion in self._secciones if seccion.startswith(prefijo)}
+
+    def columna_texto(self, campo: str) -> List[str]:
+        """Todos los valores de un campo como texto ('' si es None o falta), decodificados en una pasada"""
+        if campo not in self._columnas:
+            return [''] * len(self.ids)
+        tipo, estado, valores, datos = self._columnas[campo]
+        if tipo == 'int':
+            textos = [str(v) for v in valores.tolist()]
+        else:
+            blob, offsets = datos.tobytes(), valores.tolist()
+            textos = [blob[inicio:fin].decode('utf-8') for inicio, fin in zip(offsets, offsets[1:])]
+        nulos = np.asarray(estado)
+        if nulos.any():
+            textos = ['' if nulo else texto for texto, nulo in zip(textos, nulos.tolist())]
+        return textos
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def convertir_pickle(origen: str = 'search_backup.pkl', destino: str = METADATA_FILE) -> MetadataStore:
+    """Convierte un search_backup.pkl existente al formato columnar"""
+    with open(origen, 'rb') as f:
+        backup_data = pickle.load(f)
+    tmp = f"{destino}.tmp"
+    escribir_metadatos(tmp, backup_data.get('productos', {}), backup_data.get('corpus', {}),
+                       backup_data.get('id_to_faiss_idx', {}), backup_data.get('faiss_idx_to_id', {}),
+                       backup_data.get('next_faiss_idx', 0), backup_data.get('timestamp', ''),
+                       backup_data.get('wal_seq', 0), backup_data.get('epoca', 0))
+    os.replace(tmp, destino)
+    return MetadataStore(destino)
+
+
+if __name__ == "__main__":
+    origen = sys.argv[1] if len(sys.argv) > 1 else 'search_backup.pkl'
+    destino = sys.argv[2] if len(sys.argv) > 2 else METADATA_FILE
+    store = convertir_pickle(origen, destino)
+    print(f"✅ {origen} -> {destino}: {len(store)} productos, {os.path.getsize(destino) / 1e6:.1f} MB")
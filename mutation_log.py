@@ -0,0 +1,164 @@
+# mutation_log.py - Log append-only de mutaciones (add/update/delete) sobre el último snapshot base
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WAL_FILE = os.getenv('INDEX_WAL_FILE', 'index_wal.log')
+
+# Cabecera por registro: largo del payload, crc32 del payload, seq
+_CABECERA = struct.Struct('<IIQ')
+_LARGO_JSON = struct.Struct('<I')
+
+
+@dataclass(frozen=True)
+class Registro:
+    """Una mutación: slot nuevo, slot anterior (-1 si no había) y embedding si el vector cambió"""
+    seq: int
+    op: str  # add | update | delete
+    producto_id: int
+    slot: int = -1
+    anterior: int = -1
+    producto: Optional[Dict] = None
+    texto: Optional[str] = None
+    embedding: Optional[np.ndarray] = None
+    epoca: int = 0  # numeración de slots a la que se refieren slot y anterior
+
+    def serializar(self) -> bytes:
+        cabecera = json.dumps({'op': self.op, 'id': self.producto_id, 'slot': self.slot, 'anterior': self.anterior,
+                               'producto': self.producto, 'texto': self.texto, 'epoca': self.epoca},
+                              default=str).encode('utf-8')
+        vector = b'' if self.embedding is None else np.ascontiguousarray(self.embedding, dtype='<f4').tobytes()
+        payload = _LARGO_JSON.pack(len(cabecera)) + cabecera + vector
+        return _CABECERA.pack(len(payload), zlib.crc32(payload), self.seq) + payload
+
+    @classmethod
+    def deserializar(cls, seq: int, payload: bytes) -> "Registro":
+        largo, = _LARGO_JSON.unpack_from(payload)
+        cabecera = json.loads(payload[_LARGO_JSON.size:_LARGO_JSON.size + largo])
+        vector = payload[_LARGO_JSON.size + largo:]
+        return cls(seq, cabecera['op'], cabecera['id'], cabecera['slot'], cabecera['anterior'],
+                   cabecera['producto'], cabecera['texto'],
+                   np.frombuffer(vector, dtype='<f4').copy() if vector else None, cabecera.get('epoca', 0))
+
+
+def _recorrer(datos: bytes) -> Iterator[tuple]:
+    """(fin, seq, payload) de cada registro completo; se detiene en la primera cola incompleta o corrupta"""
+    posicion = 0
+    while posicion + _CABECERA.size <= len(datos):
+        largo, crc, seq = _CABECERA.unpack_from(datos, posicion)
+        payload = datos[posicion + _CABECERA.size:posicion + _CABECERA.size + largo]
+        if len(payload) < largo or zlib.crc32(payload) != crc:
+            return
+        posicion += _CABECERA.size + largo
+        yield posicion, seq, payload
+
+
+def serializar_registros(registros: List[Registro]) -> bytes:
+    """Mismo formato que el archivo de log: sirve de cuerpo binario para enviar deltas por HTTP"""
+    return b''.join(registro.serializar() for registro in registros)
+
+
+def leer_registros(datos: bytes) -> List[Registro]:
+    """Registros de un cuerpo recibido por red; a diferencia del archivo, una cola corrupta es un error"""
+    registros, fin = [], 0
+    for fin, seq, payload in _recorrer(datos):
+        registros.append(Registro.deserializar(seq, payload))
+    if fin != len(datos):
+        raise ValueError(f"Cuerpo de registros incompleto o corrupto en el byte {fin}")
+    return registros
+
+
+def leer_log(path: str = WAL_FILE, desde_seq: int = 0) -> Iterator[Registro]:
+    """Registros válidos con seq > desde_seq, en orden"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        datos = f.read()
+    for _, seq, payload in _recorrer(datos):
+        if seq > desde_seq:
+            yield Registro.deserializar(seq, payload)
+
+
+def leer_desde(path: str = WAL_FILE, desde_seq: int = 0, posicion: Tuple[int, int] = (0, 0)
+               ) -> Tuple[List[Registro], Tuple[int, int]]:
+    """Registros con seq > desde_seq leyendo desde (inodo, offset) de la lectura anterior; devuelve la nueva
+    posición. Si el log fue reescrito (compactación, otro inodo) se lee desde el principio"""
+    if not os.path.exists(path):
+        return [], (0, 0)
+    with open(path, 'rb') as f:
+        inodo = os.fstat(f.fileno()).st_ino
+        offset = posicion[1] if posicion[0] == inodo and posicion[1] <= os.fstat(f.fileno()).st_size else 0
+        f.seek(offset)
+        datos = f.read()
+    registros, fin = [], 0
+    for fin, seq, payload in _recorrer(datos):
+        if seq > desde_seq:
+            registros.append(Registro.deserializar(seq, payload))
+    return registros, (inodo, offset + fin)
+
+
+class MutationLog:
+    """Escritor del log: cada lote se agrega con un solo write + fsync; compactar descarta lo ya incluido en la base"""
+
+    def __init__(self, path: str = WAL_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.registros = 0
+        self.ultimo_seq = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                datos = f.read()
+            valido = 0
+            for valido, seq, _ in _recorrer(datos):
+                self.registros += 1
+                self.ultimo_seq = seq
+            if valido < len(datos):
+                #un write cortado a mitad (caída) deja basura al final: se descarta
+                logger.warning(f"⚠️ Cola incompleta en {path}: se descartan {len(datos) - valido} bytes")
+                with open(path, 'r+b') as f:
+                    f.truncate(valido)
+        self.bytes_escritos = 0
+        self.fsyncs = 0
+
+    def tamano(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def agregar(self, registros: List[Registro]):
+        """Durable al volver: costo proporcional al lote, no al catálogo"""
+        if not registros:
+            return
+        datos = serializar_registros(registros)
+        with self.lock:
+            with open(self.path, 'ab') as f:
+                f.write(datos)
+                f.flush()
+                os.fsync(f.fileno())
+            self.registros += len(registros)
+            self.ultimo_seq = max(self.ultimo_seq, registros[-1].seq)
+            self.bytes_escritos += len(datos)
+            self.fsyncs += 1
+
+    def compactar(self, hasta_seq: int):
+        """Reescribe el log solo con los registros posteriores al snapshot base (seq > hasta_seq)"""
+        with self.lock:
+            restantes = list(leer_log(self.path, hasta_seq))
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(serializar_registros(restantes))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.registros = len(restantes)
+
+    def stats(self) -> Dict:
+        return {"path": self.path, "bytes": self.tamano(), "records": self.registros, "last_seq": self.ultimo_seq,
+                "bytes_written": self.bytes_escritos, "fsyncs": self.fsyncs}
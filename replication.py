@@ -0,0 +1,265 @@
+# replication.py - Réplicas de búsqueda en otros hosts: el updater empuja los deltas por HTTP
+# (cuerpo binario del log de mutaciones) y una réplica atrasada se pone al día con el log o con un snapshot
+import hmac
+import io
+import logging
+import os
+import tarfile
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+from mutation_log import Registro, leer_log, leer_registros, serializar_registros
+
+logger = logging.getLogger(__name__)
+
+# Updater: réplicas fijas separadas por coma (además se pueden registrar en /replicate/register)
+SEARCH_REPLICAS = [url.strip().rstrip('/') for url in os.getenv('SEARCH_REPLICAS', '').split(',') if url.strip()]
+# Updater: únicas URLs aceptadas en /replicate/register (además de SEARCH_REPLICAS)
+SEARCH_REPLICAS_ALLOWED = {url.strip().rstrip('/') for url in os.getenv('SEARCH_REPLICAS_ALLOWED', '').split(',')
+                           if url.strip()} | set(SEARCH_REPLICAS)
+# Secreto compartido entre updater y réplicas: va en cada petición /replicate/*; sin él esos endpoints dan 403
+REPLICATION_TOKEN = os.getenv('REPLICATION_TOKEN', '')
+CABECERA_TOKEN = 'X-Replication-Token'
+# URL con la que las réplicas llegan al updater para descargar log y snapshot
+UPDATER_PUBLIC_URL = os.getenv('UPDATER_PUBLIC_URL', 'http://localhost:8001')
+REPLICA_TIMEOUT = float(os.getenv('REPLICA_TIMEOUT', '5'))
+# Timeout de la descarga de snapshot (catálogo completo)
+REPLICA_SNAPSHOT_TIMEOUT = float(os.getenv('REPLICA_SNAPSHOT_TIMEOUT', '300'))
+# Deltas sin enviar por réplica; al superarlos se descartan y la réplica se pone al día con log o snapshot
+REPLICA_MAX_PENDIENTES = int(os.getenv('REPLICA_MAX_PENDING', '256'))
+
+TIPO_BINARIO = 'application/octet-stream'
+
+
+def exigir_token(token: Optional[str]):
+    """403 si la petición no trae REPLICATION_TOKEN (comparación en tiempo constante) o si no hay token configurado"""
+    if not REPLICATION_TOKEN or not hmac.compare_digest((token or '').encode(), REPLICATION_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Token de replicación inválido o no configurado")
+
+
+def crear_sesion(pool: int = 4):
+    """requests.Session con conexiones keep-alive en pool; reintentos solo de conexión"""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool,
+                          max_retries=Retry(connect=2, read=0, backoff_factor=0.2))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if REPLICATION_TOKEN:
+        session.headers[CABECERA_TOKEN] = REPLICATION_TOKEN
+    return session
+
+
+def empaquetar_snapshot(archivos: Iterable[str]) -> bytes:
+    """tar sin comprimir con los archivos base que existan (vectores, metadatos, índice)"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for path in archivos:
+            if os.path.exists(path):
+                tar.add(path, arcname=os.path.basename(path))
+    return buffer.getvalue()
+
+
+def desempaquetar_snapshot(datos: bytes, archivos: List[str]) -> List[str]:
+    """Escribe los archivos del tar (solo los nombres esperados) y los reemplaza en el orden dado"""
+    permitidos = {os.path.basename(path): path for path in archivos}
+    escritos = {}
+    with tarfile.open(fileobj=io.BytesIO(datos), mode='r') as tar:
+        for miembro in tar.getmembers():
+            destino = permitidos.get(miembro.name)
+            if destino is None or not miembro.isfile():
+                continue
+            tmp = f"{destino}.replica_tmp"
+            with tar.extractfile(miembro) as origen, open(tmp, 'wb') as f:
+                f.write(origen.read())
+            escritos[destino] = tmp
+    #mismo orden que el updater: el índice nuevo nunca apunta a vectores o metadatos viejos
+    for path in archivos:
+        if path in escritos:
+            os.replace(escritos[path], path)
+    return list(escritos)
+
+
+def descargar_log(session, fuente: str, desde_seq: int, epoca: int) -> Optional[List[Registro]]:
+    """Registros con seq > desde_seq de la misma época; None si el log ya no los tiene (hace falta snapshot)"""
+    respuesta = session.get(f"{fuente}/replicate/log", params={"desde": desde_seq, "epoca": epoca},
+                            timeout=REPLICA_TIMEOUT)
+    if respuesta.status_code in (409, 410):
+        return None
+    respuesta.raise_for_status()
+    return leer_registros(respuesta.content)
+
+
+def descargar_snapshot(session, fuente: str, archivos: List[str], seq: Optional[int] = None,
+                       epoca: Optional[int] = None) -> List[str]:
+    """Baja y reemplaza los archivos base; con seq/epoca la fuente responde 304 si su base no es más nueva"""
+    params = {} if seq is None else {"seq": seq, "epoca": epoca}
+    respuesta = session.get(f"{fuente}/replicate/snapshot", params=params, timeout=REPLICA_SNAPSHOT_TIMEOUT)
+    if respuesta.status_code == 304:
+        return []
+    respuesta.raise_for_status()
+    return desempaquetar_snapshot(respuesta.content, archivos)
+
+
+class ReplicaPusher:
+    """Lado updater: un hilo por réplica mantiene el orden de los envíos sin frenar el group commit.
+    La cola de cada réplica está acotada: si se llena (réplica caída o lenta) se descarta y la réplica
+    se pone al día después con la cola del log o con el snapshot"""
+
+    def __init__(self, replicas: Iterable[str] = (), wal_path: Optional[str] = None,
+                 fuente: str = UPDATER_PUBLIC_URL, max_pendientes: int = REPLICA_MAX_PENDIENTES):
+        self.wal_path = wal_path
+        self.fuente = fuente
+        self.max_pendientes = max_pendientes
+        self.lock = threading.Condition()
+        self.replicas: Dict[str, Dict] = {}
+        self._colas: Dict[str, deque] = {}
+        self._pool = 0
+        self.session = None
+        for url in replicas:
+            self.registrar(url)
+
+    def _ajustar_sesion(self):
+        """Un pool de conexiones por host: la sesión crece con las réplicas registradas (bajo self.lock)"""
+        if self.session is None or len(self.replicas) > self._pool:
+            self._pool = max(4, 2 * len(self.replicas))
+            #los envíos en curso terminan con la sesión anterior
+            self.session = crear_sesion(pool=self._pool)
+
+    def registrar(self, url: str) -> bool:
+        url = url.rstrip('/')
+        with self.lock:
+            if url in self.replicas:
+                return False
+            self.replicas[url] = {"seq": None, "epoca": None, "envios": 0, "bytes": 0, "errores": 0,
+                                  "pendientes": 0, "descartados": 0, "requiere_catchup": False,
+                                  "catchups_log": 0, "catchups_snapshot": 0, "ultimo_ms": None}
+            self._colas[url] = deque()
+            self._ajustar_sesion()
+        threading.Thread(target=self._bucle, args=(url,), name="replica-push", daemon=True).start()
+        logger.info(f"📡 Réplica registrada: {url}")
+        return True
+
+    def quitar(self, url: str) -> bool:
+        """Deja de empujar a la réplica; los cuerpos pendientes se liberan y su hilo termina"""
+        url = url.rstrip('/')
+        with self.lock:
+            if url not in self.replicas:
+                return False
+            del self.replicas[url]
+            del self._colas[url]
+            self.lock.notify_all()
+        logger.info(f"📡 Réplica dada de baja: {url}")
+        return True
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def enviar(self, registros: List[Registro]):
+        """Encola el delta para cada réplica; el cuerpo se serializa una sola vez"""
+        if not registros or not self.replicas:
+            return
+        cuerpo = serializar_registros(registros)
+        with self.lock:
+            for url, cola in self._colas.items():
+                estado = self.replicas[url]
+                if estado["requiere_catchup"]:
+                    #el catch-up pendiente ya cubre este delta
+                    continue
+                if len(cola) >= self.max_pendientes:
+                    estado["descartados"] += len(cola)
+                    cola.clear()
+                    estado["requiere_catchup"] = True
+                    logger.warning(f"⚠️ {url} acumuló {self.max_pendientes} deltas sin enviar: se descartan "
+                                   f"y se pondrá al día con el log o el snapshot")
+                else:
+                    cola.append((cuerpo, registros[-1].seq, registros[-1].epoca))
+                estado["pendientes"] = len(cola)
+            self.lock.notify_all()
+
+    def catchup_todos(self):
+        """Tras un rebuild (época nueva) las réplicas tienen que bajar el snapshot"""
+        with self.lock:
+            for url, cola in self._colas.items():
+                cola.clear()
+                self.replicas[url].update(pendientes=0, requiere_catchup=True)
+            self.lock.notify_all()
+
+    def _bucle(self, url: str):
+        """Hilo de una réplica: envía los deltas en orden o, si hace falta, la pone al día"""
+        while True:
+            with self.lock:
+                while url in self._colas and not self._colas[url] and not self.replicas[url]["requiere_catchup"]:
+                    self.lock.wait()
+                if url not in self._colas:
+                    return
+                estado, session = self.replicas[url], self.session
+                if estado["requiere_catchup"]:
+                    estado["requiere_catchup"] = False
+                    trabajo = None
+                else:
+                    trabajo = self._colas[url].popleft()
+                    estado["pendientes"] = len(self._colas[url])
+            if trabajo is None:
+                self._ponerse_al_dia(session, url, estado)
+            else:
+                self._enviar_a(session, url, estado, *trabajo)
+
+    def _post_delta(self, session, url: str, estado: Dict, cuerpo: bytes):
+        inicio = time.perf_counter()
+        respuesta = session.post(f"{url}/replicate/delta", data=cuerpo, timeout=REPLICA_TIMEOUT,
+                                 headers={"Content-Type": TIPO_BINARIO})
+        estado["envios"] += 1
+        estado["bytes"] += len(cuerpo)
+        estado["ultimo_ms"] = round(1000 * (time.perf_counter() - inicio), 2)
+        return respuesta
+
+    def _enviar_a(self, session, url: str, estado: Dict, cuerpo: bytes, ultimo_seq: int, epoca: int):
+        try:
+            respuesta = self._post_delta(session, url, estado, cuerpo)
+            if respuesta.status_code == 200:
+                estado["seq"], estado["epoca"] = ultimo_seq, epoca
+                return
+            if respuesta.status_code != 409:
+                respuesta.raise_for_status()
+            replica = respuesta.json()
+            estado["seq"], estado["epoca"] = replica.get("seq"), replica.get("epoca")
+            if not replica.get("catchup"):
+                self._ponerse_al_dia(session, url, estado)
+        except Exception as e:
+            #la réplica queda atrasada: el próximo envío devuelve 409 y se pone al día
+            estado["errores"] += 1
+            logger.warning(f"⚠️ No se pudo enviar el delta a {url}: {e}")
+
+    def _ponerse_al_dia(self, session, url: str, estado: Dict):
+        """Primero con la cola del log (si la réplica está en la misma época y el log la cubre); si no, snapshot"""
+        try:
+            if self.wal_path and estado["seq"] is not None:
+                registros = list(leer_log(self.wal_path, estado["seq"]))
+                if (registros and registros[0].seq == estado["seq"] + 1
+                        and registros[0].epoca == estado["epoca"]):
+                    respuesta = self._post_delta(session, url, estado, serializar_registros(registros))
+                    if respuesta.status_code == 200:
+                        estado["seq"] = registros[-1].seq
+                        estado["catchups_log"] += 1
+                        logger.info(f"📡 {url} al día con {len(registros)} registros del log")
+                        return
+            respuesta = session.post(f"{url}/replicate/catchup", json={"fuente": self.fuente},
+                                     timeout=REPLICA_TIMEOUT)
+            respuesta.raise_for_status()
+            estado["catchups_snapshot"] += 1
+            logger.info(f"📡 {url} se pone al día desde el snapshot de {self.fuente}")
+        except Exception as e:
+            estado["errores"] += 1
+            logger.warning(f"⚠️ No se pudo poner al día a {url}: {e}")
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {url: dict(estado) for url, estado in self.replicas.items()}
@@ -6,6 +6,7 @@ echo "🔍 Verificando estado de los servicios..."
 # Verificar faiss_search
 echo "Probando faiss_search (puerto 8002)..."
 curl -f http://localhost:8002/health || echo "❌ faiss_search no responde"
+curl -f http://localhost:8002/ready || echo "⏳ faiss_search aún no está listo para servir"
 
 # Verificar updater
 echo "Probando updater (puerto 8001)..."
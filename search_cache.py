@@ -0,0 +1,77 @@
+# search_cache.py - Cachés en memoria para el servicio de búsqueda
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalizar_query(query: str) -> str:
+    """Forma canónica de la consulta: NFC, minúsculas y espacios colapsados"""
+    return ' '.join(unicodedata.normalize('NFC', query).lower().split())
+
+
+class LRUCache:
+    """Caché LRU acotada, con TTL opcional (TLRU) y contadores de uso"""
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entrada = self._data.get(key)
+            if entrada is None:
+                self.misses += 1
+                return None
+
+            valor, expira = entrada
+            if expira is not None and expira < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return valor
+
+    def put(self, key: Hashable, valor: Any):
+        if self.max_entries <= 0:
+            return
+
+        expira = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (valor, expira)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / consultas, 4) if consultas else 0.0
+            }
@@ -0,0 +1,81 @@
+# tests/commit_concurrency.py - Mutaciones concurrentes con commit sin ventana mientras el compactador del log
+# escribe snapshots base: ningún hilo debe quedar bloqueado (orden de locks _snapshot_lock -> lock)
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+HILOS = 8
+MUTACIONES_POR_HILO = 40
+TIMEOUT = 60
+
+
+def preparar_directorio() -> str:
+    """Copia los archivos de índice actuales a un directorio temporal para no tocar los reales"""
+    destino = tempfile.mkdtemp(prefix='commit_concurrency_')
+    for archivo in ('search_meta.bin', 'search_backup.pkl', 'faiss_index.bin', 'faiss_vectors.npy'):
+        if os.path.exists(archivo):
+            shutil.copy(archivo, destino)
+    return destino
+
+
+def main():
+    os.chdir(preparar_directorio())
+    #commit en el hilo de la petición y compactación del log después de cada registro
+    os.environ.update(UPDATER_COMMIT_WINDOW_MS='0', UPDATER_WAL_COMPACT_RECORDS='1',
+                      UPDATER_WAL_COMPACT_INTERVAL='0.01', EMBEDDING_STORE_ENABLED='0')
+    import updater as up
+
+    u = up.updater
+    u._notify_search_service = lambda *args, **kwargs: None
+    if not u.productos:
+        print("⚠️ Sin productos indexados: se necesita un índice cargado para la prueba")
+        return
+    base = {producto_id: dict(producto) for producto_id, producto in list(u.productos.items())[:HILOS * 10]}
+    bd = dict(base)
+    u._obtener_producto_desde_mysql = lambda producto_id: bd.get(producto_id)
+    ids = list(base)
+
+    errores = []
+
+    def mutar(hilo: int):
+        try:
+            for i in range(MUTACIONES_POR_HILO):
+                producto_id = ids[(hilo * 10 + i) % len(ids)]
+                if i % 13 == 12:
+                    u.rebuild_index()  #fuerza _requiere_snapshot: el commit escribe la base completa
+                elif i % 5 == 4:
+                    bd.pop(producto_id, None)
+                    u.delete_product(producto_id)
+                else:
+                    bd[producto_id] = dict(base[producto_id], nombre=f"concurrente {hilo} {i}")
+                    u.update_product(producto_id)
+        except Exception as e:
+            errores.append(e)
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=mutar, args=(n,), daemon=True) for n in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    limite = time.monotonic() + TIMEOUT
+    for hilo in hilos:
+        hilo.join(max(0.0, limite - time.monotonic()))
+    bloqueados = [hilo for hilo in hilos if hilo.is_alive()]
+
+    print(f"⏱️ {HILOS * MUTACIONES_POR_HILO} mutaciones en {time.perf_counter() - inicio:.2f}s, "
+          f"commits: {u.commits.stats()['commits']}")
+    assert not bloqueados, f"{len(bloqueados)} hilos bloqueados tras {TIMEOUT}s (deadlock)"
+    assert not errores, errores
+    #una mutación posterior sigue funcionando
+    bd[ids[0]] = dict(base[ids[0]], nombre="después")
+    assert u.update_product(ids[0])
+    print("✅ Sin deadlock entre commits y compactador")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# tests/encoder_parity.py - Paridad y latencia de los backends de encoder frente al modelo PyTorch fp32
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from encoders import ENCODER_BACKENDS, crear_encoder, verificar_paridad
+from metadata_store import METADATA_FILE, MetadataStore
+
+CONSULTAS = ["smartphone", "zapatillas running", "auriculares inalámbricos", "camiseta algodón talla M",
+             "cafetera", "mochila para laptop", "reloj deportivo", "silla de oficina"]
+
+
+def cargar_textos(ruta='search_backup.pkl', n=256):
+    if os.path.exists(METADATA_FILE):
+        corpus = MetadataStore(METADATA_FILE).corpus
+    elif os.path.exists(ruta):
+        with open(ruta, 'rb') as f:
+            corpus = pickle.load(f).get('corpus', {})
+    else:
+        return CONSULTAS
+    return [corpus[i] for i in sorted(corpus)[:n]] or CONSULTAS
+
+
+def latencia_consulta(encoder, repeticiones=5) -> float:
+    """ms promedio de encode de una consulta individual (el caso de /search)"""
+    encoder.encode(CONSULTAS[:1])
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        for consulta in CONSULTAS:
+            encoder.encode([consulta])
+    return 1000 * (time.perf_counter() - inicio) / (repeticiones * len(CONSULTAS))
+
+
+def main():
+    textos = cargar_textos()
+    referencia = crear_encoder('torch')
+    vectores_ref = referencia.encode(textos)
+    print(f"📦 {len(textos)} textos del catálogo")
+    print(f"\n{'backend':<12}{'cos_min':>9}{'cos_medio':>11}{'ms/query':>10}")
+
+    backends = sys.argv[1:] or ENCODER_BACKENDS
+    for backend in backends:
+        try:
+            encoder = referencia if backend == 'torch' else crear_encoder(backend)
+        except Exception as e:
+            print(f"{backend:<12}❌ no disponible: {e}")
+            continue
+        paridad = verificar_paridad(encoder, textos, vectores_ref)
+        estado = "✅" if paridad["ok"] else "⚠️"
+        print(f"{backend:<12}{paridad['cos_min']:>9.4f}{paridad['cos_medio']:>11.4f}"
+              f"{latencia_consulta(encoder):>10.2f} {estado}")
+
+
+if __name__ == "__main__":
+    main()
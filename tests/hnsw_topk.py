@@ -0,0 +1,66 @@
+# tests/hnsw_topk.py - Top-k después de borrar en un índice HNSW: los vectores borrados quedan en el índice
+# base como slots sin producto y la búsqueda tiene que pedir de más para devolver k resultados vivos
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, RAIZ)
+
+QUERY = "smartphone"
+BORRADOS = 10
+K_MAX = 5
+
+
+def preparar_directorio() -> str:
+    """Copia los archivos de índice actuales a un directorio temporal para no tocar los reales"""
+    destino = tempfile.mkdtemp(prefix='hnsw_topk_')
+    for archivo in ('search_meta.bin', 'search_backup.pkl', 'faiss_index.bin', 'faiss_vectors.npy'):
+        if os.path.exists(archivo):
+            shutil.copy(archivo, destino)
+    return destino
+
+
+def main():
+    os.chdir(preparar_directorio())
+    #HNSW sin compactación: los borrados quedan como tombstones en la base escrita a disco
+    os.environ.update(INDEX_TYPE='hnsw', UPDATER_COMPACT_MIN='1000000000', INDEX_WATCH_INTERVAL='0',
+                      SEARCH_BATCH_SIZE='1', EMBEDDING_STORE_ENABLED='0')
+    import updater as up
+    from search_cache import normalizar_query
+
+    u = up.updater
+    u._notify_search_service = lambda *args, **kwargs: None
+    if len(u.productos) <= BORRADOS + K_MAX:
+        print("⚠️ Pocos productos indexados: se necesita un índice cargado para la prueba")
+        return
+    assert u.rebuild_index()
+
+    #se borran los productos más parecidos a la consulta: serían los primeros resultados
+    query_vec = np.asarray(u._encode([normalizar_query(QUERY)]), dtype=np.float32)[0]
+    ids = list(u.id_to_faiss_idx)
+    similitudes = u._vectores_de([u.id_to_faiss_idx[producto_id] for producto_id in ids]) @ query_vec
+    borrados = {ids[i] for i in np.argsort(-similitudes)[:BORRADOS]}
+    u._obtener_producto_desde_mysql = lambda producto_id: None
+    for producto_id in borrados:
+        assert u.delete_product(producto_id)
+    assert u._escribir_base()
+
+    import faiss_search as fs
+    s = fs.search_service
+    s.iniciar(esperar=True)
+    print(f"🪦 Slots sin producto en la base HNSW: {s.snapshot.slots_muertos}")
+    assert s.snapshot.slots_muertos >= BORRADOS
+
+    for k in range(1, K_MAX + 1):
+        resultados = s.search_by_mode(QUERY, -1.0, k, 'semantic', fs.ParametrosBusqueda())
+        assert len(resultados) == k, f"k={k}: {len(resultados)} resultados"
+        assert not borrados & {producto_id for producto_id, _ in resultados}, f"k={k}: devolvió borrados"
+    print(f"✅ Top-k completo (k=1..{K_MAX}) tras {BORRADOS} borrados en HNSW")
+
+
+if __name__ == "__main__":
+    main()
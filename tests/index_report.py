@@ -0,0 +1,63 @@
+# tests/index_report.py - Recall/latencia/tamaño de distintas configuraciones de índice sobre el catálogo
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from index_factory import INDEX_CONFIG, crear_indice, describir_indice, leer_indice, medir_recall
+
+# (tipo, transformación, dimensión de salida)
+CONFIGURACIONES = [
+    ('flat', '', 0),
+    ('flat', 'pca', 384),
+    ('flat', 'pca', 256),
+    ('flat', 'opq', 256),
+    ('hnsw', '', 0),
+    ('hnsw', 'pca', 256),
+    ('ivf', 'pca', 256),
+    ('sq8', 'pca', 256),
+]
+
+
+def cargar_embeddings(ruta_vectores='faiss_vectors.npy', ruta_indice='faiss_index.bin') -> np.ndarray:
+    """Vectores completos del updater; si no existen se reconstruyen desde un índice sin comprimir"""
+    if os.path.exists(ruta_vectores):
+        return np.ascontiguousarray(np.load(ruta_vectores), dtype=np.float32)
+    index = leer_indice(ruta_indice)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def medir_latencia(index: faiss.Index, consultas: np.ndarray, k: int = 10) -> float:
+    """ms promedio por consulta individual"""
+    inicio = time.perf_counter()
+    for consulta in consultas:
+        index.search(consulta.reshape(1, -1), k)
+    return 1000 * (time.perf_counter() - inicio) / len(consultas)
+
+
+def main():
+    embeddings = cargar_embeddings()
+    n, dimension = embeddings.shape
+    print(f"📦 Catálogo: {n} vectores de {dimension} dimensiones")
+    consultas = embeddings[np.random.default_rng(0).choice(n, min(200, n), replace=False)]
+
+    print(f"\n{'config':<18}{'bytes/vec':>10}{'recall@10':>11}{'+rerank':>9}{'ms/query':>10}{'build s':>9}")
+    for tipo, transformacion, dim in CONFIGURACIONES:
+        config = dict(INDEX_CONFIG, type=tipo, transform=transformacion, transform_dim=dim)
+        inicio = time.perf_counter()
+        index = crear_indice(dimension, embeddings, config)
+        construccion = time.perf_counter() - inicio
+
+        info = describir_indice(index)
+        nombre = f"{tipo}/{transformacion}{dim}" if transformacion else tipo
+        print(f"{nombre:<18}{str(info['bytes_por_vector']):>10}"
+              f"{medir_recall(index, embeddings):>11.3f}"
+              f"{medir_recall(index, embeddings, rerank=INDEX_CONFIG['rerank']):>9.3f}"
+              f"{medir_latencia(index, consultas):>10.3f}{construccion:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# tests/mmap_rss.py - Memoria privada (RssAnon) al leer el índice con y sin mmap: con mmap las páginas del
+# archivo son compartidas entre workers y la memoria privada por proceso no crece con el tamaño del índice
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+# La memoria privada con mmap debe quedar por debajo de esta fracción del archivo
+MAX_FRACCION_MMAP = 0.25
+
+MEDIR = """
+import os, sys
+sys.path.insert(0, {raiz!r})
+os.environ['INDEX_MMAP'] = {mmap!r}
+import numpy as np
+
+def rss_anon():
+    with open('/proc/self/status') as f:
+        return next(int(l.split()[1]) for l in f if l.startswith('RssAnon')) / 1024
+
+import faiss_search
+antes = rss_anon()
+index = faiss_search.leer_indice_faiss(faiss_search.INDEX_FILE)
+index.search(np.random.rand(4, index.d).astype('float32'), 10)
+print(rss_anon() - antes)
+"""
+
+
+def medir(mmap: bool) -> float:
+    """Cada medición en un proceso nuevo, como un worker de uvicorn"""
+    salida = subprocess.run([sys.executable, '-c', MEDIR.format(raiz=RAIZ, mmap='1' if mmap else '0')],
+                            capture_output=True, text=True, check=True).stdout
+    return float(salida.strip().splitlines()[-1])
+
+
+def main():
+    if not os.path.exists('faiss_index.bin'):
+        print("⚠️ No existe faiss_index.bin en el directorio actual")
+        return
+    tamano = os.path.getsize('faiss_index.bin') / 2 ** 20
+    en_memoria, con_mmap = medir(False), medir(True)
+    print(f"📦 faiss_index.bin: {tamano:.1f} MB")
+    print(f"🧠 RssAnon sin mmap: +{en_memoria:.1f} MB | con mmap: +{con_mmap:.1f} MB")
+    assert con_mmap < MAX_FRACCION_MMAP * tamano, "el índice no quedó mapeado: cada worker tiene su copia"
+    print("✅ Índice compartido por mmap")
+
+
+if __name__ == "__main__":
+    main()
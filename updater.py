@@ -1,13 +1,12 @@
 # updater.py - Servicio que actualiza archivos .bin y notifica a faiss_search
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-from sentence_transformers import SentenceTransformer
+from fastapi import Body, FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response
 import faiss
 import numpy as np
 import mysql.connector
 import uvicorn
 from mysql.connector import Error
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 import pickle
 import os
 from datetime import datetime
@@ -15,6 +14,16 @@ import threading
 import requests
 import logging
 
+from encoders import ENCODER_PARITY_CHECK, crear_encoder, identidad_encoder, muestra_paridad, verificar_paridad
+from embedding_store import EMBEDDING_STORE_ENABLED, EmbeddingStore
+from metadata_store import METADATA_FILE, MetadataStore, array_faiss_a_id, escribir_metadatos
+from index_factory import (INDEX_CONFIG, agregar, crear_indice, describir_indice, eliminar, es_comprimido,
+                           leer_indice, medir_recall, reconstruye_exacto, serializar_indice)
+from batching import GroupCommit
+from mutation_log import WAL_FILE, MutationLog, Registro, leer_log, serializar_registros
+from replication import (CABECERA_TOKEN, SEARCH_REPLICAS, SEARCH_REPLICAS_ALLOWED, TIPO_BINARIO, ReplicaPusher,
+                         empaquetar_snapshot, exigir_token)
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,45 +35,39 @@ DB_CONFIG = {
     'password': 'pass'
 }
 
-app = FastAPI(title="Updater Service - FAISS Index Manager", version="1.0.0")
+# Vectores float32 de precisión completa (fila = faiss_idx); el servicio de búsqueda los lee por mmap
+# para re-rankear candidatos de índices comprimidos (SQ/PQ). Con flat/HNSW no se escriben: el índice ya los tiene
+VECTORS_FILE = 'faiss_vectors.npy'
 
-class IndexUpdater:
-    #def __init__(self, search_service_url: str = "http://faiss_search:8002"):
-    def __init__(self, search_service_url: str = "http://localhost:8002"):
-        start_time = datetime.now()
-        self.model = SentenceTransformer('sentence-transformers/all-mpnet-base-v2')
-        self.dimension = 768
-        self.search_service_url = search_service_url
-        self.lock = threading.RLock()
-        
-        # Datos en memoria
-        self.productos = {}
-        self.corpus = {}
-        self.id_to_faiss_idx = {}
-        self.faiss_idx_to_id = {}
-        self.next_faiss_idx = 0
-        self.index = faiss.IndexFlatIP(self.dimension)
-        
-        # Cargar datos existentes
-        self._load_current_index()
-        elapsed = (datetime.now() - start_time).total_seconds()
-        logger.info(f"✅ SearchService listo en {elapsed:.2f} segundos")
-    
-    def _get_db_connection(self):
-        try:
-            return mysql.connector.connect(**DB_CONFIG)
-        except Error as e:
-            logger.error(f"❌ Error conectando a MySQL: {e}")
-            return None
-    
-    def _obtener_producto_desde_mysql(self, producto_id: int) -> Optional[Dict]:
-        connection = self._get_db_connection()
-        if not connection:
-            return None
-            
-        try:
-            cursor = connection.cursor(dictionary=True)
-            query = """
+# Los metadatos se publican en formato columnar (search_meta.bin); el pickle solo si se pide para compatibilidad
+METADATA_PICKLE = os.getenv('METADATA_PICKLE', '0') == '1'
+
+# Compactación: cuando los slots sin producto superan esta fracción (y este mínimo) se re-indexa
+# con los vectores guardados, sin volver a pasar el corpus por el modelo
+COMPACT_RATIO = float(os.getenv('UPDATER_COMPACT_RATIO', '0.2'))
+COMPACT_MIN = int(os.getenv('UPDATER_COMPACT_MIN', '1000'))
+
+# Group commit: las mutaciones de esta ventana (o hasta este máximo) se persisten y notifican una sola vez
+# (UPDATER_COMMIT_WINDOW_MS=0 = un commit por mutación, como antes)
+COMMIT_WINDOW_MS = float(os.getenv('UPDATER_COMMIT_WINDOW_MS', '50'))
+COMMIT_MAX_BATCH = int(os.getenv('UPDATER_COMMIT_MAX_BATCH', '256'))
+# 1 = la petición responde cuando su cambio está en disco; 0 = responde al aplicarlo en memoria
+COMMIT_WAIT = os.getenv('UPDATER_COMMIT_WAIT', '1') == '1'
+
+# Log de mutaciones: cada commit agrega solo los registros del lote (un fsync); el snapshot completo
+# se reescribe en segundo plano cuando el log supera estos límites (UPDATER_WAL=0 = snapshot en cada commit)
+WAL_ENABLED = os.getenv('UPDATER_WAL', '1') == '1'
+WAL_COMPACT_BYTES = int(float(os.getenv('UPDATER_WAL_COMPACT_MB', '64')) * 1024 * 1024)
+WAL_COMPACT_RECORDS = int(os.getenv('UPDATER_WAL_COMPACT_RECORDS', '10000'))
+WAL_COMPACT_INTERVAL = float(os.getenv('UPDATER_WAL_COMPACT_INTERVAL', '300'))
+
+# /update/batch: ids por consulta IN a MySQL
+BATCH_FETCH_SIZE = int(os.getenv('UPDATER_BATCH_FETCH_SIZE', '1000'))
+# Acciones aceptadas en /update/batch (modify = update, como en /update/modify)
+ACCIONES_LOTE = {'add': 'add', 'modify': 'update', 'update': 'update', 'delete': 'delete'}
+
+# Producto de catálogo con sus variantes en texto; cada consulta agrega su WHERE
+SQL_PRODUCTO = """
             SELECT
                 v.id,
                 v.id_padre,
@@ -98,8 +101,89 @@ class IndexUpdater:
             FROM tienda_catalogoproductos v
             LEFT JOIN tienda_catalogoproductopadre p
                 ON v.id_padre = p.id
-            WHERE v.id = %s AND v.activo = '1';
             """
+
+
+def agregar_filas(arr: np.ndarray, filas: np.ndarray) -> np.ndarray:
+    """Agrega filas usando la capacidad libre del buffer base (que crece al doble): O(1) amortizado por fila"""
+    n, m = len(arr), len(filas)
+    base = arr.base
+    if (isinstance(base, np.ndarray) and base.dtype == arr.dtype and base.shape[1:] == arr.shape[1:]
+            and len(base) >= n + m and base.__array_interface__['data'][0] == arr.__array_interface__['data'][0]):
+        base[n:n + m] = filas
+        return base[:n + m]
+    base = np.empty((max(16, 2 * (n + m)),) + arr.shape[1:], dtype=arr.dtype)
+    base[:n] = arr
+    base[n:n + m] = filas
+    return base[:n + m]
+
+
+def agregar_fila(arr: np.ndarray, fila) -> np.ndarray:
+    return agregar_filas(arr, np.asarray(fila, dtype=arr.dtype).reshape((1,) + arr.shape[1:]))
+
+app = FastAPI(title="Updater Service - FAISS Index Manager", version="1.0.0")
+
+class IndexUpdater:
+    #def __init__(self, search_service_url: str = "http://faiss_search:8002"):
+    def __init__(self, search_service_url: str = "http://localhost:8002"):
+        start_time = datetime.now()
+        self.encoder = crear_encoder()
+        self.dimension = self.encoder.dimension
+        # Vectores ya calculados por texto: rebuilds y updates sin cambios de texto no pasan por el modelo
+        self.embedding_store = EmbeddingStore(self.dimension, identidad_encoder(self.encoder)) \
+            if EMBEDDING_STORE_ENABLED else None
+        self.search_service_url = search_service_url
+        self.lock = threading.RLock()
+        self.wal = MutationLog(WAL_FILE) if WAL_ENABLED else None
+        self.seq = 0  # último registro de mutación aplicado en memoria
+        self._requiere_snapshot = False  # slots renumerados (rebuild/compactación): el log ya no basta
+        self.epoca = 0  # generación de la numeración de slots; sube con cada rebuild/compactación
+        self.seq_base = 0  # seq y época del snapshot base escrito en disco
+        self.epoca_base = 0
+        self._snapshot_lock = threading.Lock()
+        self._compactar_log = threading.Event()
+        self.commits = GroupCommit(self._persistir_lote, COMMIT_WINDOW_MS, COMMIT_MAX_BATCH, nombre="updater-commit")
+        
+        # Datos en memoria
+        self.productos = {}
+        self.corpus = {}
+        self.id_to_faiss_idx = {}
+        self.faiss_a_id = np.empty(0, dtype=np.int64)  # producto_id por fila FAISS (-1 = sin producto)
+        self.next_faiss_idx = 0
+        self.index = crear_indice(self.dimension)
+        #copia float32 por slot solo si el índice no devuelve el vector exacto (comprimidos, IVF); None = del índice
+        self.vectores = self._copia_vectores(np.zeros((0, self.dimension), dtype=np.float32))
+        self.ultimo_recall = None
+        self.paridad_encoder = None
+        
+        # Réplicas de búsqueda en otros hosts: reciben el delta por HTTP en vez del ping de recarga
+        self.replicas = ReplicaPusher(SEARCH_REPLICAS, self.wal.path if self.wal else None)
+        
+        # Cargar datos existentes (snapshot base + log de mutaciones)
+        self._load_current_index()
+        if self.wal is not None:
+            threading.Thread(target=self._compactador_log, name="wal-compactor", daemon=True).start()
+        if ENCODER_PARITY_CHECK:
+            textos, filas = muestra_paridad(self.corpus, self.id_to_faiss_idx, self._slots_con_vector())
+            self.paridad_encoder = verificar_paridad(self.encoder, textos, self._vectores_de(filas))
+        elapsed = (datetime.now() - start_time).total_seconds()
+        logger.info(f"✅ SearchService listo en {elapsed:.2f} segundos")
+    
+    def _get_db_connection(self):
+        try:
+            return mysql.connector.connect(**DB_CONFIG)
+        except Error as e:
+            logger.error(f"❌ Error conectando a MySQL: {e}")
+            return None
+    
+    def _obtener_producto_desde_mysql(self, producto_id: int) -> Optional[Dict]:
+        connection = self._get_db_connection()
+        if not connection:
+            return None
+            
+        try:
+            cursor = connection.cursor(dictionary=True)
+            query = SQL_PRODUCTO + "WHERE v.id = %s AND v.activo = '1';"
             cursor.execute(query, (producto_id,))
             producto = cursor.fetchone()
             return producto
@@ -112,56 +196,198 @@ class IndexUpdater:
                 cursor.close()
                 connection.close()
     
+    def _obtener_productos_desde_mysql(self, producto_ids: List[int]) -> Dict[int, Dict]:
+        """Varios productos con la misma consulta (IN por bloques); sin conexión lanza error en vez de
+        devolver vacío, para que un lote no confunda la caída de la BD con productos eliminados"""
+        productos = {}
+        if not producto_ids:
+            return productos
+        connection = self._get_db_connection()
+        if not connection:
+            raise ConnectionError("No se pudo conectar a MySQL")
+        
+        try:
+            cursor = connection.cursor(dictionary=True)
+            for inicio in range(0, len(producto_ids), BATCH_FETCH_SIZE):
+                bloque = producto_ids[inicio:inicio + BATCH_FETCH_SIZE]
+                query = SQL_PRODUCTO + f"WHERE v.id IN ({', '.join(['%s'] * len(bloque))}) AND v.activo = '1';"
+                cursor.execute(query, tuple(bloque))
+                for producto in cursor.fetchall():
+                    productos[producto['id']] = producto
+            return productos
+        finally:
+            if connection.is_connected():
+                cursor.close()
+                connection.close()
+    
     def _crear_texto_producto(self, producto: Dict) -> str:
         nombre = producto.get('nombre', '') or ''
         descripcion = producto.get('descripcion', '') or ''
         variante_comb = producto.get('variante_comb', '') or ''
         return f"{nombre} {descripcion} {variante_comb}".strip()
     
+    def _encode(self, textos: List[str]) -> np.ndarray:
+        if self.embedding_store is not None:
+            return self.embedding_store.encode(self.encoder, textos)
+        return self.encoder.encode(textos)
+    
     def _load_current_index(self):
         """Carga el índice actual desde archivos"""
         try:
-            if os.path.exists('search_backup.pkl') and os.path.exists('faiss_index.bin'):
-                with open('search_backup.pkl', 'rb') as f:
-                    backup_data = pickle.load(f)
-                
-                self.productos = backup_data.get('productos', {})
-                self.corpus = backup_data.get('corpus', {})
-                self.id_to_faiss_idx = backup_data.get('id_to_faiss_idx', {})
-                self.faiss_idx_to_id = backup_data.get('faiss_idx_to_id', {})
-                self.next_faiss_idx = backup_data.get('next_faiss_idx', 0)
+            hay_metadatos = os.path.exists(METADATA_FILE) or os.path.exists('search_backup.pkl')
+            if hay_metadatos and os.path.exists('faiss_index.bin'):
+                if os.path.exists(METADATA_FILE):
+                    #el updater modifica los datos: se materializan como dicts
+                    store = MetadataStore(METADATA_FILE)
+                    self.productos = dict(store.productos.items())
+                    self.corpus = dict(store.corpus.items())
+                    self.id_to_faiss_idx = dict(store.id_to_faiss_idx.items())
+                    self.faiss_a_id = np.array(store.faiss_to_id, dtype=np.int64)
+                    self.next_faiss_idx = store.next_faiss_idx
+                    self.seq = store.wal_seq
+                    self.epoca = store.epoca
+                else:
+                    with open('search_backup.pkl', 'rb') as f:
+                        backup_data = pickle.load(f)
+                    
+                    self.productos = backup_data.get('productos', {})
+                    self.corpus = backup_data.get('corpus', {})
+                    self.id_to_faiss_idx = backup_data.get('id_to_faiss_idx', {})
+                    self.faiss_a_id = array_faiss_a_id(backup_data.get('faiss_idx_to_id', {}))
+                    self.next_faiss_idx = backup_data.get('next_faiss_idx', 0)
+                    self.seq = backup_data.get('wal_seq', 0)
+                    self.epoca = backup_data.get('epoca', 0)
                 
-                self.index = faiss.read_index('faiss_index.bin')
+                self.index = leer_indice('faiss_index.bin')
+                self.vectores = self._cargar_vectores()
+                self.seq_base, self.epoca_base = self.seq, self.epoca
                 
                 logger.info(f"✅ Índice cargado: {len(self.productos)} productos")
             else:
                 logger.info("⚠️ No se encontraron archivos de índice existentes")
+                self._requiere_snapshot = True
+            self._reproducir_log()
         except Exception as e:
             logger.error(f"❌ Error cargando índice: {e}")
     
-    def _save_index_files(self):
-        try:
-            backup_data = {
-                'productos': self.productos,
-                'corpus': self.corpus,
-                'id_to_faiss_idx': self.id_to_faiss_idx,
-                'faiss_idx_to_id': self.faiss_idx_to_id,
+    def _reproducir_log(self):
+        """Aplica los registros del log posteriores al snapshot base (seq > self.seq)"""
+        if self.wal is None:
+            return
+        aplicados = 0
+        for registro in leer_log(self.wal.path, self.seq):
+            self._aplicar_registro(registro)
+            aplicados += 1
+        self.seq = max(self.seq, self.wal.ultimo_seq)
+        if aplicados:
+            logger.info(f"📜 {aplicados} mutaciones del log aplicadas sobre el snapshot base")
+    
+    def _aplicar_registro(self, registro: Registro):
+        producto_id = registro.producto_id
+        #el slot vigente sale del mapeo propio: un rebuild durante la reproducción renumera los slots
+        anterior = self.id_to_faiss_idx.get(producto_id)
+        if anterior is not None and (registro.op == 'delete' or registro.embedding is not None):
+            self._quitar_slot(anterior)
+        if registro.op == 'delete':
+            self.id_to_faiss_idx.pop(producto_id, None)
+            self.productos.pop(producto_id, None)
+            self.corpus.pop(producto_id, None)
+            return
+        self.productos[producto_id] = registro.producto
+        if registro.texto is not None:
+            self.corpus[producto_id] = registro.texto
+        if registro.embedding is not None:
+            slot = self._agregar_slot(producto_id, registro.embedding)
+            if slot != registro.slot:
+                logger.warning(f"⚠️ Slot {slot} != {registro.slot} al reproducir el registro {registro.seq}")
+            self.id_to_faiss_idx[producto_id] = slot
+    
+    def _registro(self, op: str, producto_id: int, **campos) -> Registro:
+        """Siguiente registro del log; se crea bajo el lock, en el mismo orden en que se aplicó en memoria"""
+        self.seq += 1
+        return Registro(self.seq, op, producto_id, epoca=self.epoca, **campos)
+    
+    def _cargar_vectores(self) -> Optional[np.ndarray]:
+        """Vectores float32 por slot: del archivo, o reconstruidos si el índice los guarda completos"""
+        if reconstruye_exacto(self.index):
+            return None
+        if os.path.exists(VECTORS_FILE):
+            vectores = np.load(VECTORS_FILE)
+            if vectores.shape[0] == self.next_faiss_idx:
+                return vectores
+            logger.warning(f"⚠️ {VECTORS_FILE} no coincide con los slots ({vectores.shape[0]} != {self.next_faiss_idx})")
+        
+        if not es_comprimido(self.index):
+            try:
+                vectores = np.zeros((self.next_faiss_idx, self.dimension), dtype=np.float32)
+                vivos = np.flatnonzero(array_faiss_a_id(self.faiss_a_id, self.next_faiss_idx) >= 0)
+                if len(vivos):
+                    vectores[vivos] = self.index.reconstruct_batch(vivos)
+                return vectores
+            except RuntimeError:
+                pass
+        
+        logger.warning("⚠️ Sin vectores completos: se regeneran en el próximo rebuild")
+        return np.zeros((0, self.dimension), dtype=np.float32)
+    
+    def _capturar_snapshot(self) -> Dict:
+        """Copia consistente del estado, tomada bajo el lock; la escritura a disco se hace fuera de él"""
+        with self.lock:
+            return {
+                'productos': dict(self.productos),
+                'corpus': dict(self.corpus),
+                'id_to_faiss_idx': dict(self.id_to_faiss_idx),
+                'faiss_a_id': self.faiss_a_id.copy(),
                 'next_faiss_idx': self.next_faiss_idx,
-                'timestamp': datetime.now().isoformat()
+                'wal_seq': self.seq,
+                'epoca': self.epoca,
+                #las filas ya escritas no cambian: append y compactación crean o extienden buffers
+                #(None: índice exacto, el servicio de búsqueda no re-rankea y no hace falta VECTORS_FILE)
+                'vectores': self.vectores,
+                'index': serializar_indice(self.index)
             }
+    
+    def _save_index_files(self, snapshot: Optional[Dict] = None):
+        try:
+            snapshot = snapshot or self._capturar_snapshot()
+            timestamp = datetime.now().isoformat()
             
             # Guardar temporalmente con sufijo
-            with open('search_backup_tmp.pkl', 'wb') as f:
-                pickle.dump(backup_data, f)
-            faiss.write_index(self.index, 'faiss_index_tmp.bin')
+            if snapshot['vectores'] is not None:
+                np.save('faiss_vectors_tmp.npy', snapshot['vectores'])
+            escribir_metadatos('search_meta_tmp.bin', snapshot['productos'], snapshot['corpus'],
+                               snapshot['id_to_faiss_idx'], snapshot['faiss_a_id'], snapshot['next_faiss_idx'],
+                               timestamp, snapshot['wal_seq'], snapshot['epoca'])
+            if METADATA_PICKLE:
+                backup_data = {
+                    'productos': snapshot['productos'],
+                    'corpus': snapshot['corpus'],
+                    'id_to_faiss_idx': snapshot['id_to_faiss_idx'],
+                    'faiss_idx_to_id': {faiss_idx: producto_id for faiss_idx, producto_id
+                                        in enumerate(snapshot['faiss_a_id'].tolist()) if producto_id >= 0},
+                    'next_faiss_idx': snapshot['next_faiss_idx'],
+                    'wal_seq': snapshot['wal_seq'],
+                    'epoca': snapshot['epoca'],
+                    'timestamp': timestamp
+                }
+                with open('search_backup_tmp.pkl', 'wb') as f:
+                    pickle.dump(backup_data, f)
+            snapshot['index'].tofile('faiss_index_tmp.bin')
             
-            # Reemplazar archivos atómicamente
-            if os.path.exists('search_backup.pkl'):
+            # Reemplazar archivos atómicamente (vectores primero: el índice nuevo nunca apunta a filas que faltan)
+            if snapshot['vectores'] is not None:
+                os.replace('faiss_vectors_tmp.npy', VECTORS_FILE)
+            elif os.path.exists(VECTORS_FILE):
+                #de un índice comprimido anterior: no corresponde a los slots nuevos
+                os.remove(VECTORS_FILE)
+            if METADATA_PICKLE and os.path.exists('search_backup.pkl'):
                 os.replace('search_backup.pkl', 'search_backup_old.pkl')
             if os.path.exists('faiss_index.bin'):
                 os.replace('faiss_index.bin', 'faiss_index_old.bin')
             
-            os.replace('search_backup_tmp.pkl', 'search_backup.pkl')
+            os.replace('search_meta_tmp.bin', METADATA_FILE)
+            if METADATA_PICKLE:
+                os.replace('search_backup_tmp.pkl', 'search_backup.pkl')
             os.replace('faiss_index_tmp.bin', 'faiss_index.bin')
             
             logger.info("💾 Archivos de índice actualizados")
@@ -171,10 +397,97 @@ class IndexUpdater:
             logger.error(f"❌ Error guardando archivos: {e}")
             return False
     
-    def _notify_search_service(self, action: str, product_id: int = None):
+    def _escribir_base(self) -> bool:
+        """Snapshot completo con el seq que incluye; después el log conserva solo los registros posteriores.
+        Orden de locks: _snapshot_lock y después self.lock (nunca al revés)"""
+        with self._snapshot_lock:
+            with self.lock:
+                snapshot = self._capturar_snapshot()
+                requeria, self._requiere_snapshot = self._requiere_snapshot, False
+            if not self._save_index_files(snapshot):
+                self._requiere_snapshot = self._requiere_snapshot or requeria
+                return False
+            if self.wal is not None:
+                self.wal.compactar(snapshot['wal_seq'])
+            epoca_anterior = self.epoca_base
+            self.seq_base, self.epoca_base = snapshot['wal_seq'], snapshot['epoca']
+            if self.replicas and snapshot['epoca'] != epoca_anterior:
+                #slots renumerados: los deltas ya no aplican sobre la base de las réplicas
+                self.replicas.catchup_todos()
+            return True
+    
+    def _persistir_lote(self, cambios: List[tuple]) -> bool:
+        """Una escritura durable y una sola notificación para todas las mutaciones del lote"""
+        registros = [registro for _, _, registro in cambios if registro is not None]
+        if self.wal is None or self._requiere_snapshot:
+            if not self._escribir_base():
+                return False
+        else:
+            try:
+                self.wal.agregar(registros)
+            except OSError as e:
+                logger.error(f"❌ Error escribiendo el log de mutaciones: {e}")
+                return False
+            if self.wal.tamano() >= WAL_COMPACT_BYTES or self.wal.registros >= WAL_COMPACT_RECORDS:
+                self._compactar_log.set()
+        if self.replicas:
+            #los registros de una época anterior ya van incluidos en el snapshot que bajan las réplicas
+            self.replicas.enviar([registro for registro in registros if registro.epoca == self.epoca_base])
+        #el servicio de búsqueda local siempre se notifica, haya o no réplicas remotas
+        seq = max((registro.seq for registro in registros), default=None)
+        if len(cambios) == 1:
+            self._notify_search_service(*cambios[0][:2], seq=seq)
+        else:
+            self._notify_search_service("batch", seq=seq)
+            logger.info(f"📦 {len(cambios)} cambios confirmados en un solo commit")
+        return True
+    
+    def _compactador_log(self):
+        """Vuelca el log a un snapshot base nuevo al superar los límites o cada WAL_COMPACT_INTERVAL segundos"""
+        while True:
+            self._compactar_log.wait(WAL_COMPACT_INTERVAL)
+            self._compactar_log.clear()
+            if not self.wal.registros:
+                continue
+            inicio = datetime.now()
+            registros = self.wal.registros
+            if self._escribir_base():
+                elapsed = (datetime.now() - inicio).total_seconds()
+                logger.info(f"🗜️ Log compactado: {registros} registros volcados al snapshot en {elapsed:.2f} segundos")
+                self._notify_search_service("snapshot")
+    
+    def paquete_snapshot(self) -> tuple:
+        """tar de los archivos base para una réplica que se pone al día; el lock evita leerlos a mitad de reemplazo"""
+        if not os.path.exists(METADATA_FILE):
+            #base solo en el pickle: se publica primero en formato columnar
+            self._escribir_base()
+        with self._snapshot_lock:
+            return empaquetar_snapshot([VECTORS_FILE, METADATA_FILE, 'faiss_index.bin']), self.seq_base, self.epoca_base
+    
+    def log_desde(self, desde_seq: int, epoca: int) -> Optional[List[Registro]]:
+        """Registros del log posteriores a desde_seq; None si el log ya no los cubre o son de otra época"""
+        if self.wal is None:
+            return None
+        registros = list(leer_log(self.wal.path, desde_seq))
+        if registros:
+            if registros[0].seq != desde_seq + 1 or registros[0].epoca != epoca:
+                return None
+        elif desde_seq < self.seq_base or epoca != self.epoca_base:
+            return None
+        return registros
+    
+    def _confirmar(self, confirmacion) -> bool:
+        """Espera a que el commit que incluye la mutación esté en disco (o no, con UPDATER_COMMIT_WAIT=0).
+        Se llama fuera de self.lock: el commit toma _snapshot_lock y después self.lock, como el compactador"""
+        self.commits.despachar()
+        if not COMMIT_WAIT and not confirmacion.done():
+            return True
+        return confirmacion.result()
+    
+    def _notify_search_service(self, action: str, product_id: int = None, seq: int = None):
         try:
             url = f"{self.search_service_url}/reload_index"
-            data = {"action": action, "product_id": product_id, "timestamp": datetime.now().isoformat()}
+            data = {"action": action, "product_id": product_id, "seq": seq, "timestamp": datetime.now().isoformat()}
             
             response = requests.post(url, json=data, timeout=5)
             if response.status_code == 200:
@@ -192,30 +505,28 @@ class IndexUpdater:
                 return False
             
             with self.lock:
-                if producto_id in self.productos:
-                    logger.info(f"⚠️ Producto {producto_id} ya existe, actualizando...")
-                    return self.update_product(producto_id)
-                
-                #crear texto y embedding
-                texto = self._crear_texto_producto(producto)
-                embedding = self.model.encode([texto], normalize_embeddings=True)
-                
-                #agregar al índice FAISS
-                self.index.add(np.array(embedding, dtype=np.float32))
-                
-                # Actualizar mapeos
-                faiss_idx = self.next_faiss_idx
-                self.productos[producto_id] = producto
-                self.corpus[producto_id] = texto
-                self.id_to_faiss_idx[producto_id] = faiss_idx
-                self.faiss_idx_to_id[faiss_idx] = producto_id
-                self.next_faiss_idx += 1
-                
-                if self._save_index_files():
-                    self._notify_search_service("add", producto_id)
-                    logger.info(f"✅ Producto {producto_id} agregado exitosamente")
-                    return True
-                
+                existe = producto_id in self.productos
+                if not existe:
+                    #crear texto y embedding
+                    texto = self._crear_texto_producto(producto)
+                    embedding = self._encode([texto])
+                    
+                    #agregar al índice FAISS y actualizar mapeos
+                    self.productos[producto_id] = producto
+                    self.corpus[producto_id] = texto
+                    slot = self._agregar_slot(producto_id, embedding)
+                    self.id_to_faiss_idx[producto_id] = slot
+                    registro = self._registro("add", producto_id, slot=slot, producto=producto, texto=texto,
+                                              embedding=embedding[0])
+                    confirmacion = self.commits.registrar(("add", producto_id, registro))
+            
+            if existe:
+                logger.info(f"⚠️ Producto {producto_id} ya existe, actualizando...")
+                return self.update_product(producto_id)
+            #la espera del commit va fuera del lock para que otras mutaciones entren en el mismo lote
+            if self._confirmar(confirmacion):
+                logger.info(f"✅ Producto {producto_id} agregado exitosamente")
+                return True
             return False
         except Exception as e:
             logger.error(f"❌ Error agregando producto {producto_id}: {e}")
@@ -234,18 +545,29 @@ class IndexUpdater:
             
             with self.lock:
                 nuevo_texto = self._crear_texto_producto(producto)
-                nuevo_embedding = self.model.encode([nuevo_texto], normalize_embeddings=True)
-                
-                self.productos[producto_id] = producto
-                self.corpus[producto_id] = nuevo_texto
-                
-                self._rebuild_index()
-                
-                if self._save_index_files():
-                    self._notify_search_service("update", producto_id)
-                    logger.info(f"✅ Producto {producto_id} actualizado exitosamente")
-                    return True
-                
+                anterior = self.id_to_faiss_idx[producto_id]
+                if nuevo_texto == self.corpus.get(producto_id) and self._vectores_completos():
+                    #mismo texto = mismo vector: solo cambian los metadatos
+                    self.productos[producto_id] = producto
+                    registro = self._registro("update", producto_id, slot=anterior, anterior=anterior,
+                                              producto=producto)
+                else:
+                    nuevo_embedding = self._encode([nuevo_texto])
+                    
+                    #solo se toca un vector: el slot viejo sale del índice y el nuevo entra al final
+                    self._quitar_slot(anterior)
+                    self.productos[producto_id] = producto
+                    self.corpus[producto_id] = nuevo_texto
+                    slot = self._agregar_slot(producto_id, nuevo_embedding)
+                    self.id_to_faiss_idx[producto_id] = slot
+                    registro = self._registro("update", producto_id, slot=slot, anterior=anterior, producto=producto,
+                                              texto=nuevo_texto, embedding=nuevo_embedding[0])
+                    self._compactar_si_hace_falta()
+                confirmacion = self.commits.registrar(("update", producto_id, registro))
+            
+            if self._confirmar(confirmacion):
+                logger.info(f"✅ Producto {producto_id} actualizado exitosamente")
+                return True
             return False
         except Exception as e:
             logger.error(f"❌ Error actualizando producto {producto_id}: {e}")
@@ -259,55 +581,268 @@ class IndexUpdater:
                 return True
             
             with self.lock:
-                faiss_idx = self.id_to_faiss_idx[producto_id]
-                
+                anterior = self.id_to_faiss_idx.pop(producto_id)
+                self._quitar_slot(anterior)
                 del self.productos[producto_id]
                 del self.corpus[producto_id]
-                del self.id_to_faiss_idx[producto_id]
-                del self.faiss_idx_to_id[faiss_idx]
-                
-                self._rebuild_index()
-                
-                if self._save_index_files():
-                    self._notify_search_service("delete", producto_id)
-                    logger.info(f"✅ Producto {producto_id} eliminado exitosamente")
-                    return True
-                
+                registro = self._registro("delete", producto_id, anterior=anterior)
+                self._compactar_si_hace_falta()
+                confirmacion = self.commits.registrar(("delete", producto_id, registro))
+            
+            if self._confirmar(confirmacion):
+                logger.info(f"✅ Producto {producto_id} eliminado exitosamente")
+                return True
             return False
         except Exception as e:
             logger.error(f"❌ Error eliminando producto {producto_id}: {e}")
             return False
     
+    def _normalizar_lote(self, cambios: List[Any]) -> Dict[int, str]:
+        """[{"action": "add", "id": 1}, ...] o [["add", 1], ...] -> {producto_id: acción}; vale la última por producto"""
+        acciones: Dict[int, str] = {}
+        for cambio in cambios:
+            if isinstance(cambio, dict):
+                accion, producto_id = cambio.get('action'), cambio.get('id')
+            elif isinstance(cambio, (list, tuple)) and len(cambio) == 2:
+                accion, producto_id = cambio
+            else:
+                raise ValueError(f"Cambio inválido: {cambio}")
+            if accion not in ACCIONES_LOTE or isinstance(producto_id, bool) or not isinstance(producto_id, int):
+                raise ValueError(f"Cambio inválido: {cambio}")
+            acciones.pop(producto_id, None)
+            acciones[producto_id] = ACCIONES_LOTE[accion]
+        return acciones
+    
+    def update_batch(self, cambios: List[Any]) -> Dict:
+        """Lote de mutaciones: una consulta a MySQL, un encode por lotes, una operación sobre el índice
+        y un solo commit. add/modify/delete se comportan como sus endpoints de a uno"""
+        inicio = datetime.now()
+        acciones = self._normalizar_lote(cambios)
+        en_bd = self._obtener_productos_desde_mysql([pid for pid, accion in acciones.items() if accion != 'delete'])
+    
+        #el encode (lo caro) va fuera del lock: solo los textos que cambiaron, de una vez
+        textos = {producto_id: self._crear_texto_producto(producto) for producto_id, producto in en_bd.items()}
+        por_codificar = list(dict.fromkeys(texto for producto_id, texto in textos.items()
+                                           if texto != self.corpus.get(producto_id)))
+        embeddings = dict(zip(por_codificar, self._encode(por_codificar))) if por_codificar else {}
+    
+        resumen = {"agregados": 0, "actualizados": 0, "eliminados": 0, "no_encontrados": []}
+        with self.lock:
+            plan = []  # (acción, producto_id, producto, texto, embedding, slot anterior) en orden de aplicación
+            quitar = []
+            for producto_id, accion in acciones.items():
+                existe = producto_id in self.productos
+                producto = en_bd.get(producto_id)
+                if accion != 'delete' and producto is None:
+                    if accion == 'add' or not existe:
+                        resumen["no_encontrados"].append(producto_id)
+                        continue
+                    #modify de un producto que ya no está en BD: se elimina, como en update_product
+                    accion = 'delete'
+                if accion == 'delete':
+                    if existe:
+                        anterior = self.id_to_faiss_idx.pop(producto_id)
+                        quitar.append(anterior)
+                        del self.productos[producto_id]
+                        self.corpus.pop(producto_id, None)
+                        plan.append(('delete', producto_id, None, None, None, anterior))
+                    continue
+    
+                texto = textos[producto_id]
+                anterior = self.id_to_faiss_idx.get(producto_id, -1)
+                accion = 'update' if existe else 'add'
+                self.productos[producto_id] = producto
+                if existe and texto == self.corpus.get(producto_id) and self._vectores_completos():
+                    #mismo texto = mismo vector: solo cambian los metadatos
+                    plan.append((accion, producto_id, producto, None, None, anterior))
+                    continue
+                if texto not in embeddings:
+                    #el texto en memoria cambió mientras se codificaba el lote
+                    embeddings[texto] = self._encode([texto])[0]
+                if anterior >= 0:
+                    quitar.append(anterior)
+                self.corpus[producto_id] = texto
+                plan.append((accion, producto_id, producto, texto, embeddings[texto], anterior))
+    
+            #el índice se toca dos veces por lote: un remove_ids y un add con todos los vectores nuevos
+            if quitar:
+                self._quitar_slots(quitar)
+            con_vector = [paso for paso in plan if paso[4] is not None]
+            slots = {}
+            if con_vector:
+                ids_nuevos = [paso[1] for paso in con_vector]
+                slots = dict(zip(ids_nuevos, self._agregar_slots(ids_nuevos, np.stack([paso[4] for paso in con_vector]))
+                                 .tolist()))
+    
+            items = []
+            for accion, producto_id, producto, texto, embedding, anterior in plan:
+                if accion == 'delete':
+                    registro = self._registro("delete", producto_id, anterior=anterior)
+                    resumen["eliminados"] += 1
+                elif embedding is None:
+                    registro = self._registro("update", producto_id, slot=anterior, anterior=anterior,
+                                              producto=producto)
+                    resumen["actualizados"] += 1
+                else:
+                    slot = slots[producto_id]
+                    self.id_to_faiss_idx[producto_id] = slot
+                    registro = self._registro(accion, producto_id, slot=slot, anterior=anterior, producto=producto,
+                                              texto=texto, embedding=embedding)
+                    resumen["agregados" if accion == 'add' else "actualizados"] += 1
+                items.append((accion, producto_id, registro))
+            self._compactar_si_hace_falta()
+            confirmacion = self.commits.registrar_lote(items) if items else None
+    
+        resumen["confirmado"] = confirmacion is None or self._confirmar(confirmacion)
+        elapsed = (datetime.now() - inicio).total_seconds()
+        logger.info(f"📦 Lote de {len(acciones)} cambios: {resumen['agregados']} agregados, "
+                    f"{resumen['actualizados']} actualizados, {resumen['eliminados']} eliminados, "
+                    f"{len(resumen['no_encontrados'])} no encontrados en {elapsed:.2f} segundos")
+        return resumen
+    
+    def rebuild_index(self) -> bool:
+        """Reconstruye el índice completo con la configuración actual (p. ej. al cambiar INDEX_TYPE)"""
+        try:
+            with self.lock:
+                self._rebuild_index()
+                descripcion = describir_indice(self.index)
+                confirmacion = self.commits.registrar(("rebuild", None, None))
+            self.commits.despachar()
+            if confirmacion.result():
+                logger.info(f"✅ Índice reconstruido: {descripcion}")
+                return True
+            return False
+        except Exception as e:
+            logger.error(f"❌ Error reconstruyendo índice: {e}")
+            return False
+    
+    def _copia_vectores(self, embeddings: np.ndarray) -> Optional[np.ndarray]:
+        """La copia residente solo se conserva si el índice no puede devolver el vector exacto de un slot"""
+        return None if reconstruye_exacto(self.index) else embeddings
+    
+    def _vectores_completos(self) -> bool:
+        return self.vectores is None or len(self.vectores) == self.next_faiss_idx
+    
+    def _slots_con_vector(self) -> int:
+        return self.next_faiss_idx if self.vectores is None else len(self.vectores)
+    
+    def _vectores_de(self, slots: np.ndarray) -> np.ndarray:
+        """Vectores float32 de slots vivos: de la copia o reconstruidos desde el índice"""
+        slots = np.asarray(slots, dtype=np.int64)
+        if self.vectores is not None:
+            return self.vectores[slots]
+        if not len(slots):
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        return self.index.reconstruct_batch(slots)
+    
+    def _agregar_slot(self, producto_id: int, embedding: np.ndarray) -> int:
+        """Agrega el vector en el siguiente slot (id en IndexIDMap2 y fila en vectores); devuelve el slot"""
+        return int(self._agregar_slots([producto_id], embedding)[0])
+    
+    def _agregar_slots(self, producto_ids: List[int], embeddings: np.ndarray) -> np.ndarray:
+        """Agrega los vectores en slots consecutivos con una sola llamada al índice; devuelve los slots"""
+        if not self._vectores_completos():
+            #sin vectores alineados no se pueden direccionar slots: se reconstruye todo una vez
+            self._rebuild_index()
+            #el rebuild ya indexó el texto actual de estos productos: esos slots sobran
+            sobrantes = [self.id_to_faiss_idx[producto_id] for producto_id in producto_ids
+                         if producto_id in self.id_to_faiss_idx]
+            if sobrantes:
+                self._quitar_slots(sobrantes)
+        inicio = self.next_faiss_idx
+        slots = np.arange(inicio, inicio + len(producto_ids), dtype=np.int64)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(producto_ids), -1)
+        agregar(self.index, embeddings, slots)
+        if self.vectores is not None:
+            self.vectores = agregar_filas(self.vectores, embeddings)
+        self.faiss_a_id = agregar_filas(array_faiss_a_id(self.faiss_a_id, inicio),
+                                        np.asarray(producto_ids, dtype=np.int64))
+        self.next_faiss_idx += len(producto_ids)
+        return slots
+    
+    def _quitar_slot(self, slot: int):
+        self._quitar_slots([slot])
+    
+    def _quitar_slots(self, slots: List[int]):
+        """Saca los vectores del índice; si el tipo no soporta borrado quedan como tombstone (faiss_a_id = -1)"""
+        slots = np.asarray(slots, dtype=np.int64)
+        if not eliminar(self.index, slots):
+            logger.info(f"🪦 {len(slots)} slot(s) marcados como tombstone ({describir_indice(self.index)['tipo']})")
+        slots = slots[slots < len(self.faiss_a_id)]
+        self.faiss_a_id[slots] = -1
+    
+    def _compactar_si_hace_falta(self):
+        huecos = self.next_faiss_idx - len(self.id_to_faiss_idx)
+        if huecos >= COMPACT_MIN and huecos > COMPACT_RATIO * self.next_faiss_idx:
+            self._compactar()
+    
+    def _compactar(self):
+        """Re-indexa solo los slots vivos con los vectores guardados (sin re-encode) y renumera slots"""
+        if not self._vectores_completos():
+            self._rebuild_index()
+            return
+        inicio = datetime.now()
+        vivos = np.flatnonzero(array_faiss_a_id(self.faiss_a_id, self.next_faiss_idx) >= 0)
+        embeddings = np.ascontiguousarray(self._vectores_de(vivos))
+        self.faiss_a_id = self.faiss_a_id[vivos].copy()
+        self.id_to_faiss_idx = {int(producto_id): slot for slot, producto_id in enumerate(self.faiss_a_id.tolist())}
+        self.index = crear_indice(self.dimension, embeddings)
+        self.vectores = self._copia_vectores(embeddings)
+        self.next_faiss_idx = len(vivos)
+        self._requiere_snapshot = True
+        self.epoca += 1
+        elapsed = (datetime.now() - inicio).total_seconds()
+        logger.info(f"🧹 Índice compactado a {len(vivos)} slots en {elapsed:.2f} segundos")
+    
     def _rebuild_index(self):
+        self._requiere_snapshot = True
+        self.epoca += 1
         if not self.corpus:
-            self.index = faiss.IndexFlatIP(self.dimension)
+            self.index = crear_indice(self.dimension)
+            self.vectores = self._copia_vectores(np.zeros((0, self.dimension), dtype=np.float32))
             self.id_to_faiss_idx.clear()
-            self.faiss_idx_to_id.clear()
+            self.faiss_a_id = np.empty(0, dtype=np.int64)
             self.next_faiss_idx = 0
             return
         
         new_id_to_faiss = {}
-        new_faiss_to_id = {}
         textos_ordenados = []
         
         for idx, (producto_id, texto) in enumerate(self.corpus.items()):
             new_id_to_faiss[producto_id] = idx
-            new_faiss_to_id[idx] = producto_id
             textos_ordenados.append(texto)
+        new_faiss_a_id = np.fromiter(self.corpus.keys(), dtype=np.int64, count=len(self.corpus))
         
         
-        embeddings = self.model.encode(textos_ordenados, normalize_embeddings=True)
-        self.index = faiss.IndexFlatIP(self.dimension)
-        self.index.add(np.array(embeddings, dtype=np.float32))
+        embeddings = self._encode(textos_ordenados)
+        if self.embedding_store is not None:
+            self.embedding_store.podar(textos_ordenados)
+        #crea, entrena (IVF/SQ/PQ) y llena el índice según INDEX_CONFIG
+        self.index = crear_indice(self.dimension, embeddings)
+        self.vectores = self._copia_vectores(embeddings)
+        
+        if es_comprimido(self.index):
+            self.ultimo_recall = {
+                "recall@10": round(medir_recall(self.index, embeddings), 4),
+                "recall@10_rerank": round(medir_recall(self.index, embeddings, rerank=INDEX_CONFIG['rerank']), 4),
+                "rerank": INDEX_CONFIG['rerank']
+            }
+            logger.info(f"📏 Recall del índice comprimido: {self.ultimo_recall}")
+        else:
+            self.ultimo_recall = None
         
         #act mapeos
         self.id_to_faiss_idx = new_id_to_faiss
-        self.faiss_idx_to_id = new_faiss_to_id
+        self.faiss_a_id = new_faiss_a_id
         self.next_faiss_idx = len(textos_ordenados)
 
 # Instancia del updater
 updater = IndexUpdater()
 
+@app.on_event("shutdown")
+def confirmar_pendientes():
+    updater.commits.flush()
+
 # Endpoints
 @app.post("/update/add/{producto_id}")
 def add_product_endpoint(producto_id: int):
@@ -342,6 +877,32 @@ def delete_product_endpoint(producto_id: int):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/update/batch")
+def batch_update_endpoint(cambios: List[Any] = Body(..., description='[{"action": "add|modify|delete", "id": 101}, ...]')):
+    try:
+        resumen = updater.update_batch(cambios)
+        if not resumen["confirmado"]:
+            raise HTTPException(status_code=500, detail="No se pudo confirmar el lote")
+        return JSONResponse(content=resumen)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/update/rebuild")
+def rebuild_index_endpoint():
+    try:
+        if updater.rebuild_index():
+            return JSONResponse(content={"mensaje": "Índice reconstruido exitosamente"})
+        else:
+            raise HTTPException(status_code=500, detail="No se pudo reconstruir el índice")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/stats")
 def get_stats():
     try:
@@ -350,12 +911,65 @@ def get_stats():
                 "total_productos": len(updater.productos),
                 "faiss_total": updater.index.ntotal,
                 "next_faiss_idx": updater.next_faiss_idx,
-                "dimension": updater.dimension
+                "dimension": updater.dimension,
+                "encoder": updater.encoder.backend,
+                "paridad_encoder": updater.paridad_encoder,
+                "embedding_store": updater.embedding_store.stats() if updater.embedding_store else None,
+                "index": describir_indice(updater.index),
+                "vectores_completos": updater._slots_con_vector(),
+                "vectores_copia_residente": updater.vectores is not None,
+                "recall": updater.ultimo_recall,
+                "group_commit": updater.commits.stats(),
+                "wal": updater.wal.stats() if updater.wal else None,
+                "epoca": updater.epoca,
+                "replicas": updater.replicas.stats(),
+                "index_config": INDEX_CONFIG
             }
         return JSONResponse(content=stats)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Replicación: las réplicas de búsqueda bajan el log o el snapshot base cuando se atrasan
+@app.post("/replicate/register")
+def register_replica_endpoint(datos: Dict = Body(...), token: Optional[str] = Header(None, alias=CABECERA_TOKEN)):
+    exigir_token(token)
+    url = str(datos.get("url") or '').rstrip('/')
+    if not url:
+        raise HTTPException(status_code=400, detail="Falta la URL de la réplica")
+    #el updater empuja el catálogo a las réplicas: solo a URLs configuradas
+    if url not in SEARCH_REPLICAS_ALLOWED:
+        logger.warning(f"⚠️ Registro de réplica rechazado: {url}")
+        raise HTTPException(status_code=403, detail="URL de réplica no permitida")
+    return {"registrada": updater.replicas.registrar(url), "seq": updater.seq_base, "epoca": updater.epoca_base}
+
+@app.post("/replicate/unregister")
+def unregister_replica_endpoint(datos: Dict = Body(...), token: Optional[str] = Header(None, alias=CABECERA_TOKEN)):
+    """Baja de una réplica (apagada o reemplazada): deja de recibir deltas y se liberan sus pendientes"""
+    exigir_token(token)
+    url = str(datos.get("url") or '').rstrip('/')
+    if not url:
+        raise HTTPException(status_code=400, detail="Falta la URL de la réplica")
+    return {"eliminada": updater.replicas.quitar(url)}
+
+@app.get("/replicate/log")
+def replicate_log_endpoint(desde: int = 0, epoca: int = 0, token: Optional[str] = Header(None, alias=CABECERA_TOKEN)):
+    exigir_token(token)
+    registros = updater.log_desde(desde, epoca)
+    if registros is None:
+        raise HTTPException(status_code=410, detail="El log ya no cubre ese seq: hace falta el snapshot")
+    return Response(content=serializar_registros(registros), media_type=TIPO_BINARIO)
+
+@app.get("/replicate/snapshot")
+def replicate_snapshot_endpoint(seq: Optional[int] = None, epoca: Optional[int] = None,
+                                token: Optional[str] = Header(None, alias=CABECERA_TOKEN)):
+    exigir_token(token)
+    #la réplica ya tiene esta base (o una posterior en la misma época): no hace falta bajarla
+    if seq is not None and epoca == updater.epoca_base and updater.seq_base <= seq:
+        return Response(status_code=304)
+    paquete, seq, epoca = updater.paquete_snapshot()
+    return Response(content=paquete, media_type='application/x-tar',
+                    headers={"X-Wal-Seq": str(seq), "X-Epoca": str(epoca)})
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "updater"}